@@ -0,0 +1,14 @@
+from openupgradelib import openupgrade
+
+
+@openupgrade.migrate()
+def migrate(env, version):
+    """The autoclose cron is now triggered when the attendances are due, and
+    only runs daily as a fallback.
+    """
+    cron = env.ref(
+        "hr_attendance_autoclose.check_attendance_cron", raise_if_not_found=False
+    )
+    if cron:
+        cron.write({"interval_number": 1, "interval_type": "days", "doall": False})
+    env["hr.attendance"]._schedule_autoclose()
@@ -1,10 +1,17 @@
 # Copyright 2018 ForgeFlow, S.L.
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
+import logging
+import threading
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+import pytz
+
 from odoo import api, fields, models
 
+_logger = logging.getLogger(__name__)
+
 
 class HrAttendance(models.Model):
     _inherit = "hr.attendance"
@@ -13,6 +20,25 @@ class HrAttendance(models.Model):
         string="Worked hours",
         compute="_compute_open_worked_hours",
     )
+    autoclose_failed_date = fields.Datetime(
+        readonly=True,
+        copy=False,
+        help="Last time the attendance could not be autoclosed. It is retried "
+        "a day later.",
+    )
+
+    def init(self):
+        """Partial index on the check-in of the open attendances, where the
+        stale ones are looked for.
+        """
+        res = super().init()
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS hr_attendance_open_check_in_index
+                ON hr_attendance (check_in) WHERE check_out IS NULL;
+            """
+        )
+        return res
 
     @api.depends("check_out", "check_in")
     def _compute_open_worked_hours(self):
@@ -23,12 +49,106 @@ class HrAttendance(models.Model):
 
     def autoclose_attendance(self, reason):
         self.ensure_one()
-        max_hours = self.employee_id.company_id.attendance_maximum_hours_per_day
-        leave_time = self.check_in + timedelta(hours=max_hours)
-        vals = {"check_out": leave_time}
+        self._autoclose_attendances(reason)
+
+    def _get_autoclose_check_out(self):
+        """Check-out of each attendance when autoclosed, once the maximum hours
+        of the company of its employee have passed. For companies closing the
+        attendances at the end of the shift, it is the end of the working
+        schedule of the employee instead, when there is a shift.
+
+        :return: Dictionary with the check-out of each attendance.
+        """
+        check_outs = {}
+        attendances_by_calendar = defaultdict(lambda: self.browse())
+        for att in self:
+            company = att.employee_id.company_id
+            max_hours = company.attendance_maximum_hours_per_day
+            check_outs[att] = att.check_in + timedelta(hours=max_hours)
+            calendar = att.employee_id.resource_calendar_id
+            if company.attendance_autoclose_calendar and calendar:
+                attendances_by_calendar[calendar] |= att
+        for calendar, attendances in attendances_by_calendar.items():
+            check_outs.update(attendances._get_shift_check_out(calendar, check_outs))
+        return check_outs
+
+    def _get_shift_check_out(self, calendar, max_check_outs):
+        """End of the shift of each attendance according to the working
+        schedule, whose intervals are computed at once for all the employees.
+        The shift is made of the intervals of the day of the first one ending
+        after the check-in, and it never ends after the maximum check-out.
+
+        :param calendar: Working schedule of the employees of the attendances.
+        :param max_check_outs: Dictionary with the maximum check-out of each
+          attendance.
+        :return: Dictionary with the check-out of the attendances with a shift.
+        """
+        resources = self.mapped("employee_id.resource_id")
+        intervals = calendar._work_intervals_batch(
+            pytz.utc.localize(min(self.mapped("check_in"))),
+            pytz.utc.localize(max(max_check_outs[att] for att in self)),
+            resources=resources,
+        )
+        check_outs = {}
+        for att in self:
+            max_check_out = max_check_outs[att]
+            shift_day = None
+            for start, stop, _meta in intervals[att.employee_id.resource_id.id]:
+                utc_start = start.astimezone(pytz.utc).replace(tzinfo=None)
+                utc_stop = stop.astimezone(pytz.utc).replace(tzinfo=None)
+                if utc_stop <= att.check_in:
+                    continue
+                if utc_start >= max_check_out:
+                    break
+                if shift_day is None:
+                    shift_day = start.date()
+                elif start.date() != shift_day:
+                    break
+                check_outs[att] = min(utc_stop, max_check_out)
+        return check_outs
+
+    def _autoclose_attendances(self, reason):
+        """Close the attendances in bulk. The reason is linked to all of them
+        at once before closing them, so that the validity constraint lets them
+        through, and the attendances closed at the same time are written
+        together. The autoclose cron is rescheduled once all of them are closed.
+        """
+        if not self:
+            return
+        attendances = self.with_context(skip_autoclose_schedule=True)
         if reason:
-            vals["attendance_reason_ids"] = [(4, reason.id)]
-        self.write(vals)
+            attendances.write({"attendance_reason_ids": [(4, reason.id)]})
+        attendances_by_check_out = defaultdict(list)
+        for att, check_out in attendances._get_autoclose_check_out().items():
+            attendances_by_check_out[check_out].append(att.id)
+        for check_out, ids in attendances_by_check_out.items():
+            attendances.browse(ids).write({"check_out": check_out})
+        if not self.env.context.get("skip_autoclose_schedule"):
+            self._schedule_autoclose()
+
+    def _autoclose_chunk(self, reason):
+        """Autoclose a chunk of attendances, retrying them one by one when
+        closing them together fails, so that only the failing ones are left
+        open.
+
+        :return: Attendances that could not be closed.
+        """
+        try:
+            with self.env.cr.savepoint():
+                self._autoclose_attendances(reason)
+            return self.browse()
+        except Exception:
+            failed = self.browse()
+            for att in self:
+                try:
+                    with self.env.cr.savepoint():
+                        att._autoclose_attendances(reason)
+                except Exception:
+                    _logger.warning(
+                        "Attendance %s could not be autoclosed", att.id, exc_info=True
+                    )
+                    failed |= att
+            return failed
 
     def needs_autoclose(self):
         self.ensure_one()
@@ -36,12 +156,184 @@ class HrAttendance(models.Model):
         close = not self.employee_id.no_autoclose
         return close and max_hours and self.open_worked_hours > max_hours
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super().create(vals_list)
+        if not self.env.context.get("skip_autoclose_schedule"):
+            attendances._schedule_autoclose_deadline()
+        return attendances
+
+    def write(self, vals):
+        res = super().write(vals)
+        if not self.env.context.get("skip_autoclose_schedule") and any(
+            field in vals for field in ("check_in", "check_out", "employee_id")
+        ):
+            self._schedule_autoclose_deadline()
+        return res
+
     @api.model
-    def check_for_incomplete_attendances(self):
-        stale_attendances = self.search([("check_out", "=", False)])
-        reason = self.env.company.hr_attendance_autoclose_reason
-        for att in stale_attendances.filtered(lambda a: a.needs_autoclose()):
-            att.autoclose_attendance(reason)
+    def _flush_autoclose_fields(self):
+        """Flush the fields the autoclose queries depend on."""
+        self.flush(["check_in", "check_out", "employee_id"])
+        self.env["hr.employee"].flush(["company_id", "no_autoclose"])
+        self.env["res.company"].flush(["attendance_maximum_hours_per_day"])
+        self.flush(["autoclose_failed_date"])
+
+    @api.model
+    def _get_stale_attendance_ids(self, after_id=0, limit=None, company=None):
+        """Ids of the open attendances that have lasted longer than the
+        maximum hours of the company of their employees, unless the employee
+        is excluded from the autoclosing or they failed to be closed less than
+        a day ago.
+
+        :param after_id: Only return the ids greater than this one.
+        :param limit: Maximum number of ids to return.
+        :param company: Only return the attendances of the employees of this
+          company. All of them if not given.
+        """
+        self._flush_autoclose_fields()
+        self.env.cr.execute(
+            """
+            SELECT att.id
+            FROM hr_attendance att
+            JOIN hr_employee emp ON emp.id = att.employee_id
+            JOIN res_company company ON company.id = emp.company_id
+            WHERE att.check_out IS NULL
+                AND NOT COALESCE(emp.no_autoclose, FALSE)
+                AND company.attendance_maximum_hours_per_day > 0
+                AND att.check_in < (now() AT TIME ZONE 'UTC')
+                    - company.attendance_maximum_hours_per_day * INTERVAL '1 hour'
+                AND (
+                    att.autoclose_failed_date IS NULL
+                    OR att.autoclose_failed_date
+                    < (now() AT TIME ZONE 'UTC') - INTERVAL '1 day'
+                )
+                AND att.id > %(after_id)s
+                AND (%(company_id)s IS NULL OR company.id = %(company_id)s)
+            ORDER BY att.id
+            LIMIT %(limit)s
+            """,
+            {
+                "after_id": after_id,
+                "company_id": company.id if company else None,
+                "limit": limit,
+            },
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _set_autoclose_watermark(self, company, attendance_id):
+        """Keep the id of the last attendance processed by the autoclose cron
+        for the company. It is written directly, as writing companies clears
+        the caches of the whole registry.
+        """
+        self.env.cr.execute(
+            """
+            UPDATE res_company SET attendance_autoclose_last_id = %s WHERE id = %s
+            """,
+            (attendance_id, company.id),
+        )
+        company.invalidate_cache(["attendance_autoclose_last_id"], company.ids)
+
+    @api.model
+    def check_for_incomplete_attendances(self, chunk_size=500):
+        """Autoclose the stale attendances of each company in chunks, committed
+        one by one. The id of the last attendance processed is kept on the
+        company until all of them are processed, so that an interrupted run is
+        resumed after it by the next one. The attendances that can't be closed
+        are logged, left open and retried a day later.
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        for company in self.env["res.company"].search([]):
+            attendances = self.with_company(company).with_context(
+                skip_autoclose_schedule=True
+            )
+            reason = company.hr_attendance_autoclose_reason
+            last_id = company.attendance_autoclose_last_id
+            while True:
+                ids = attendances._get_stale_attendance_ids(
+                    after_id=last_id, limit=chunk_size, company=company
+                )
+                if not ids:
+                    break
+                failed = attendances.browse(ids)._autoclose_chunk(reason)
+                failed.write({"autoclose_failed_date": fields.Datetime.now()})
+                last_id = ids[-1]
+                self._set_autoclose_watermark(company, last_id)
+                if auto_commit:
+                    self.env.cr.commit()  # pylint: disable=invalid-commit
+                self.invalidate_cache()
+            if company.attendance_autoclose_last_id:
+                self._set_autoclose_watermark(company, 0)
+        self._schedule_autoclose()
+
+    @api.model
+    def _get_next_autoclose_date(self):
+        """Date when the first open attendance will have to be autoclosed,
+        whether it has already passed or not. The attendances that failed to
+        be closed are due a day after the failure.
+        """
+        self._flush_autoclose_fields()
+        self.env.cr.execute(
+            """
+            SELECT MIN(
+                GREATEST(
+                    att.check_in
+                    + company.attendance_maximum_hours_per_day * INTERVAL '1 hour',
+                    att.autoclose_failed_date + INTERVAL '1 day'
+                )
+            )
+            FROM hr_attendance att
+            JOIN hr_employee emp ON emp.id = att.employee_id
+            JOIN res_company company ON company.id = emp.company_id
+            WHERE att.check_out IS NULL
+                AND NOT COALESCE(emp.no_autoclose, FALSE)
+                AND company.attendance_maximum_hours_per_day > 0
+            """
+        )
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _schedule_autoclose(self):
+        """Trigger the autoclose cron when the first open attendance is due."""
+        date = self._get_next_autoclose_date()
+        if date:
+            self._trigger_autoclose(date)
+
+    def _schedule_autoclose_deadline(self):
+        """Trigger the autoclose cron when the first of these attendances is
+        due, if they are open. The deadlines are computed from the records
+        being written, without looking for the rest of the open attendances.
+        """
+        deadlines = []
+        for att in self.sudo():
+            if att.check_out or att.employee_id.no_autoclose:
+                continue
+            max_hours = att.employee_id.company_id.attendance_maximum_hours_per_day
+            if max_hours > 0:
+                deadlines.append(att.check_in + timedelta(hours=max_hours))
+        if deadlines:
+            self._trigger_autoclose(min(deadlines))
+
+    @api.model
+    def _trigger_autoclose(self, date):
+        """Trigger the autoclose cron at the given date, unless it is already
+        triggered between now and then. The cron triggers itself again for
+        the next due attendance after each run, so an earlier trigger is
+        enough.
+        """
+        cron = self.env.ref(
+            "hr_attendance_autoclose.check_attendance_cron", raise_if_not_found=False
+        )
+        if not cron:
+            return
+        now = fields.Datetime.now()
+        date = max(date.replace(microsecond=0), now)
+        if self.env["ir.cron.trigger"].sudo().search_count(
+            [("cron_id", "=", cron.id), ("call_at", ">=", now), ("call_at", "<=", date)]
+        ):
+            return
+        cron.sudo()._trigger(at=date)
 
     @api.constrains("check_in", "check_out", "employee_id")
     def _check_validity(self):
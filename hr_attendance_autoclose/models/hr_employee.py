@@ -11,3 +11,9 @@ class HrEmployee(models.Model):
     no_autoclose = fields.Boolean(
         string="Don't Autoclose Attendances", groups="hr.group_hr_user"
     )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "no_autoclose" in vals or "company_id" in vals:
+            self.env["hr.attendance"]._schedule_autoclose()
+        return res
@@ -14,3 +14,23 @@ class ResCompany(models.Model):
             raise_if_not_found=False,
         ),
     )
+
+    attendance_autoclose_calendar = fields.Boolean(
+        string="Autoclose At The End Of The Shift",
+        help="Close the attendances at the end of the shift of the working "
+        "schedule of the employee, or after the maximum hours when there is "
+        "no shift.",
+    )
+
+    attendance_autoclose_last_id = fields.Integer(
+        string="Last Autoclosed Attendance",
+        readonly=True,
+        help="Last attendance processed by the autoclose scheduled action, "
+        "which resumes after it when interrupted.",
+    )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "attendance_maximum_hours_per_day" in vals:
+            self.env["hr.attendance"]._schedule_autoclose()
+        return res
@@ -12,3 +12,7 @@ class ResConfigSettings(models.TransientModel):
         related="company_id.hr_attendance_autoclose_reason",
         readonly=False,
     )
+    attendance_autoclose_calendar = fields.Boolean(
+        related="company_id.attendance_autoclose_calendar",
+        readonly=False,
+    )
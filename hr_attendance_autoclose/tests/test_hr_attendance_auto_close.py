@@ -3,9 +3,11 @@
 
 
 from datetime import datetime
+from unittest.mock import patch
 
 from dateutil.relativedelta import relativedelta
 
+from odoo import fields
 from odoo.tests import common, new_test_user, users
 from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT as DF
 
@@ -50,6 +52,190 @@ class TestHrAttendanceReason(common.TransactionCase):
         self.hr_attendance.check_for_incomplete_attendances()
         self.assertFalse(att2.attendance_reason_ids)
 
+    def test_stale_attendance_detection(self):
+        now = datetime.now()
+        excluded = self.env["hr.employee"].create(
+            {"name": "Excluded Employee", "no_autoclose": True}
+        )
+        recent_employee = self.env["hr.employee"].create({"name": "Recent Employee"})
+        stale = self.hr_attendance.create(
+            {"employee_id": self.employee.id, "check_in": now - relativedelta(hours=12)}
+        )
+        excluded_att = self.hr_attendance.create(
+            {"employee_id": excluded.id, "check_in": now - relativedelta(hours=12)}
+        )
+        recent = self.hr_attendance.create(
+            {
+                "employee_id": recent_employee.id,
+                "check_in": now - relativedelta(hours=2),
+            }
+        )
+        stale_ids = self.hr_attendance._get_stale_attendance_ids()
+        self.assertIn(stale.id, stale_ids)
+        self.assertNotIn(excluded_att.id, stale_ids)
+        self.assertNotIn(recent.id, stale_ids)
+        self.assertTrue(stale.needs_autoclose())
+        self.env.company.attendance_maximum_hours_per_day = 0
+        self.assertNotIn(stale.id, self.hr_attendance._get_stale_attendance_ids())
+        self.env.company.attendance_maximum_hours_per_day = 11
+        self.hr_attendance.check_for_incomplete_attendances()
+        self.assertEqual(stale.worked_hours, 11.0)
+        self.assertFalse(excluded_att.check_out)
+        self.assertFalse(recent.check_out)
+
+    def _create_open_attendances(self, count):
+        check_in = datetime.now().replace(microsecond=0) - relativedelta(hours=14)
+        employees = self.env["hr.employee"].create(
+            [{"name": "Employee %s" % i} for i in range(count)]
+        )
+        return self.hr_attendance.create(
+            [
+                {
+                    "employee_id": employee.id,
+                    # Checked in at two different times
+                    "check_in": check_in - relativedelta(minutes=i % 2),
+                }
+                for i, employee in enumerate(employees)
+            ]
+        )
+
+    def test_autoclose_attendances_bulk(self):
+        reason = self.env.company.hr_attendance_autoclose_reason
+        attendances = self._create_open_attendances(6)
+        written = []
+        write = type(attendances).write
+
+        def spy_write(records, vals):
+            written.append((records, vals))
+            return write(records, vals)
+
+        with patch.object(type(attendances), "write", spy_write):
+            attendances._autoclose_attendances(reason)
+        # One write per distinct check-out, not per attendance
+        check_out_writes = [records for records, vals in written if "check_out" in vals]
+        self.assertEqual([len(records) for records in check_out_writes], [3, 3])
+        self.assertEqual(
+            attendances.mapped("check_out"),
+            [att.check_in + relativedelta(hours=11) for att in attendances],
+        )
+        self.assertEqual(attendances.mapped("worked_hours"), [11.0] * 6)
+        for attendance in attendances:
+            self.assertEqual(attendance.attendance_reason_ids, reason)
+
+    def test_autoclose_schedule(self):
+        cron = self.env.ref("hr_attendance_autoclose.check_attendance_cron")
+        now = fields.Datetime.now()
+        trigger_domain = [("cron_id", "=", cron.id), ("call_at", ">", now)]
+        Trigger = self.env["ir.cron.trigger"]
+        check_in = now - relativedelta(hours=2)
+        att = self.hr_attendance.create(
+            {"employee_id": self.employee.id, "check_in": check_in}
+        )
+        self.assertEqual(
+            Trigger.search(trigger_domain).mapped("call_at"),
+            [check_in + relativedelta(hours=11)],
+        )
+        # An attendance due later doesn't trigger the cron again
+        employee = self.env["hr.employee"].create({"name": "Employee 2"})
+        self.hr_attendance.create({"employee_id": employee.id, "check_in": now})
+        self.assertEqual(len(Trigger.search(trigger_domain)), 1)
+        # Nor closing an attendance
+        att.check_out = check_in + relativedelta(hours=1)
+        self.assertEqual(len(Trigger.search(trigger_domain)), 1)
+        # A shorter maximum makes the open attendance due earlier
+        self.env.company.attendance_maximum_hours_per_day = 9
+        self.assertEqual(
+            min(Trigger.search(trigger_domain).mapped("call_at")),
+            now + relativedelta(hours=9),
+        )
+
+    def test_autoclose_calendar(self):
+        calendar = self.env["resource.calendar"].create(
+            {
+                "name": "Test Calendar",
+                "tz": "UTC",
+                "attendance_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": "Shift",
+                            "dayofweek": str(day),
+                            "hour_from": hour_from,
+                            "hour_to": hour_to,
+                        },
+                    )
+                    for day in range(5)
+                    for hour_from, hour_to in ((8, 12), (13, 17))
+                ],
+            }
+        )
+        employees = self.employee | self.env["hr.employee"].create(
+            {"name": "Employee 2"}
+        )
+        employees.write({"resource_calendar_id": calendar.id, "tz": "UTC"})
+        self.env.company.attendance_autoclose_calendar = True
+        # Monday and Saturday
+        attendances = self.hr_attendance.create(
+            [
+                {
+                    "employee_id": employees[0].id,
+                    "check_in": datetime(2022, 1, 3, 7, 55),
+                },
+                {
+                    "employee_id": employees[1].id,
+                    "check_in": datetime(2022, 1, 8, 9, 0),
+                },
+            ]
+        )
+        attendances._autoclose_attendances(
+            self.env.company.hr_attendance_autoclose_reason
+        )
+        self.assertEqual(
+            attendances.mapped("check_out"),
+            [datetime(2022, 1, 3, 17, 0), datetime(2022, 1, 8, 20, 0)],
+        )
+
+    def test_autoclose_resumable(self):
+        self.env.company.hr_attendance_autoclose_reason = False
+        now = fields.Datetime.now()
+        employees = self.employee | self.env["hr.employee"].create(
+            [{"name": "Employee 2"}, {"name": "Employee 3"}]
+        )
+        self.hr_attendance.create(
+            {
+                "employee_id": employees[0].id,
+                "check_in": now - relativedelta(hours=5),
+                "check_out": now - relativedelta(hours=4),
+            }
+        )
+        # Closing it after 11 hours overlaps the previous attendance
+        failing, first, second = self.hr_attendance.create(
+            [
+                {"employee_id": employee.id, "check_in": now - relativedelta(hours=14)}
+                for employee in employees
+            ]
+        )
+        company = self.env.company
+        # Resume after the last attendance processed by an interrupted run
+        self.hr_attendance._set_autoclose_watermark(company, first.id)
+        self.hr_attendance.check_for_incomplete_attendances(chunk_size=1)
+        self.assertFalse(failing.check_out)
+        self.assertFalse(first.check_out)
+        self.assertTrue(second.check_out)
+        # The scan is complete
+        self.assertFalse(company.attendance_autoclose_last_id)
+        with self.assertLogs(
+            "odoo.addons.hr_attendance_autoclose.models.hr_attendance", "WARNING"
+        ):
+            self.hr_attendance.check_for_incomplete_attendances(chunk_size=1)
+        self.assertFalse(failing.check_out)
+        self.assertTrue(failing.autoclose_failed_date)
+        self.assertEqual(first.worked_hours, 11.0)
+        # The failing attendance is retried a day later
+        self.assertNotIn(failing.id, self.hr_attendance._get_stale_attendance_ids())
+        self.assertGreater(self.hr_attendance._get_next_autoclose_date(), now)
+
     @users("test-user")
     def test_hr_employee_can_still_read_employee_and_hr_public_employee(self):
         """This test ensure the following comment from hr.employee model has been take
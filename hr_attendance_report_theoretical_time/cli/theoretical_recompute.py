@@ -0,0 +1,165 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import logging
+import multiprocessing
+import optparse
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+
+import odoo
+from odoo.cli import Command
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Key of the advisory locks of the recomputation, as a positive 32 bits integer
+LOCK_KEY = zlib.crc32(b"hr_attendance_report_theoretical_time.recompute") & 0x7FFFFFFF
+
+
+def _recompute_partition(dbname, employee_ids, date_from, date_to):
+    """Recompute the attendances of a partition in a cursor of its own, which
+    is committed when done.
+
+    :return: Number of recomputed attendances, or None if the partition is
+      being recomputed by another transaction.
+    """
+    registry = odoo.registry(dbname)
+    with registry.cursor() as cr:
+        cr.execute(
+            "SELECT pg_try_advisory_xact_lock(%s, %s)", (LOCK_KEY, employee_ids[0])
+        )
+        if not cr.fetchone()[0]:
+            return None
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        return env["recompute.theoretical.attendance.job"]._recompute_partition(
+            employee_ids, date_from=date_from, date_to=date_to
+        )
+
+
+class TheoreticalRecompute(Command):
+    """Recompute the theoretical hours of all the attendances in parallel"""
+
+    def run(self, cmdargs):
+        parser = config.parser
+        group = optparse.OptionGroup(parser, "Theoretical Hours Recomputation")
+        group.add_option(
+            "--processes",
+            dest="processes",
+            type="int",
+            default=os.cpu_count(),
+            help="Number of processes recomputing partitions at the same time "
+            "(number of CPUs by default)",
+        )
+        group.add_option(
+            "--chunk-size",
+            dest="chunk_size",
+            type="int",
+            default=50,
+            help="Maximum number of employees of each partition (50 by default)",
+        )
+        group.add_option(
+            "--companies",
+            dest="companies",
+            default="",
+            help="Comma-separated ids of the companies to recompute (all of "
+            "them by default)",
+        )
+        group.add_option(
+            "--date-from",
+            dest="date_from",
+            help="First date to recompute, as YYYY-MM-DD (unbounded by default)",
+        )
+        group.add_option(
+            "--date-to",
+            dest="date_to",
+            help="Last date to recompute, as YYYY-MM-DD (unbounded by default)",
+        )
+        parser.add_option_group(group)
+        opt = config.parse_config(cmdargs)
+        dbname = config["db_name"]
+        if not dbname:
+            sys.exit("A database must be given with -d")
+        company_ids = [int(x) for x in opt.companies.split(",") if x.strip()]
+        # The lock of the whole run is held by a connection of its own, out of
+        # the pool of Odoo, that is emptied before forking the processes
+        __, connection_info = odoo.sql_db.connection_info_for(dbname)
+        lock_cnx = psycopg2.connect(**connection_info)
+        lock_cnx.autocommit = True
+        try:
+            with lock_cnx.cursor() as lock_cr:
+                lock_cr.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_KEY,))
+                if not lock_cr.fetchone()[0]:
+                    sys.exit(
+                        "The theoretical hours of %s are already being "
+                        "recomputed" % dbname
+                    )
+            registry = odoo.registry(dbname)
+            with registry.cursor() as cr:
+                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+                Job = env["recompute.theoretical.attendance.job"]
+                partitions = Job._get_partitions(
+                    chunk_size=opt.chunk_size, company_ids=company_ids
+                )
+            odoo.sql_db.close_all()
+            failed = self._run_partitions(dbname, partitions, opt)
+        finally:
+            lock_cnx.close()
+        if failed:
+            sys.exit("%s partitions have not been recomputed" % failed)
+
+    def _run_partitions(self, dbname, partitions, opt):
+        """Recompute the partitions in a pool of processes.
+
+        :return: Number of partitions not recomputed.
+        """
+        _logger.info(
+            "Recomputing the theoretical hours of %s partitions with %s processes",
+            len(partitions),
+            opt.processes,
+        )
+        failed = 0
+        with ProcessPoolExecutor(
+            max_workers=opt.processes, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _recompute_partition,
+                    dbname,
+                    employee_ids,
+                    opt.date_from,
+                    opt.date_to,
+                ): (company_id, employee_ids)
+                for company_id, employee_ids in partitions
+            }
+            for future in as_completed(futures):
+                company_id, employee_ids = futures[future]
+                try:
+                    count = future.result()
+                except Exception:
+                    _logger.exception(
+                        "Error recomputing the employees %s of the company %s",
+                        employee_ids,
+                        company_id,
+                    )
+                    failed += 1
+                    continue
+                if count is None:
+                    _logger.warning(
+                        "Employees %s of the company %s are locked by another "
+                        "transaction",
+                        employee_ids,
+                        company_id,
+                    )
+                    failed += 1
+                else:
+                    _logger.info(
+                        "Recomputed %s attendances of %s employees of the company %s",
+                        count,
+                        len(employee_ids),
+                        company_id,
+                    )
+        return failed
@@ -0,0 +1,55 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, http
+from odoo.http import content_disposition, request
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv;charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class TheoreticalTimeExport(http.Controller):
+    @http.route(
+        "/hr_attendance_report_theoretical_time/export", type="http", auth="user"
+    )
+    def export_theoretical_time(self, wizard_id, **kwargs):
+        """Stream the totals of the theoretical time report for the employees,
+        dates and period of the given wizard.
+        """
+        wizard = request.env["wizard.theoretical.time"].browse(int(wizard_id)).exists()
+        if not wizard:
+            raise request.not_found()
+        request.env["hr.attendance.theoretical.time.report"].check_access_rights(
+            "read"
+        )
+        domain = wizard._prepare_export_domain()
+        period = wizard.export_period
+        file_format = wizard.export_format
+        registry = request.env.registry
+        uid = request.env.uid
+        context = dict(request.env.context)
+
+        def generate():
+            # The request cursor is closed once the response is returned, so
+            # the rows are read through a new one while the file is sent
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                report = env["hr.attendance.theoretical.time.report"]
+                if file_format == "xlsx":
+                    yield from report._export_totals_xlsx(domain, period=period)
+                else:
+                    yield from report._export_totals_csv(domain, period=period)
+
+        filename = "theoretical_time_%s_%s.%s" % (
+            wizard.export_date_from,
+            wizard.export_date_to,
+            file_format,
+        )
+        return request.make_response(
+            generate(),
+            headers=[
+                ("Content-Type", EXPORT_MIMETYPES[file_format]),
+                ("Content-Disposition", content_disposition(filename)),
+            ],
+        )
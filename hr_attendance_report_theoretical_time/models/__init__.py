@@ -1,8 +1,14 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
 from . import hr_attendance
+from . import hr_attendance_theoretical_balance
+from . import hr_attendance_theoretical_stat
+from . import hr_attendance_theoretical_day
 from . import hr_employee
 from . import hr_employee_public
 from . import hr_holidays_public
 from . import hr_leave
 from . import hr_leave_type
+from . import recompute_theoretical_attendance_job
+from . import res_config_settings
+from . import resource_calendar
@@ -1,8 +1,12 @@
 # Copyright 2017-2019 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from collections import defaultdict
+
 from odoo import api, fields, models
 
+from .hr_attendance_theoretical_stat import instrument
+
 
 class HrAttendance(models.Model):
     _inherit = "hr.attendance"
@@ -11,10 +15,92 @@ class HrAttendance(models.Model):
         compute="_compute_theoretical_hours", store=True, compute_sudo=True
     )
 
+    def init(self):
+        """Indexes for the theoretical time report, that filters attendances by
+        check-in date, and the recomputations, that search them by employee and
+        check-in.
+        """
+        res = super().init()
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS hr_attendance_employee_check_in_index
+                ON hr_attendance (employee_id, check_in);
+            CREATE INDEX IF NOT EXISTS hr_attendance_check_in_date_index
+                ON hr_attendance ((check_in::date));
+            """
+        )
+        return res
+
     @api.depends("check_in", "employee_id")
     def _compute_theoretical_hours(self):
+        """Compute the theoretical hours in one go for all the attendances of
+        each employee, reusing the cache of theoretical hours of the context.
+        """
         obj = self.env["hr.attendance.theoretical.time.report"]
+        cache = obj._get_theoretical_cache()
+        records_by_employee = defaultdict(list)
         for record in self:
-            record.theoretical_hours = obj._theoretical_hours(
-                record.employee_id, record.check_in
-            )
+            if record.employee_id and record.check_in:
+                records_by_employee[record.employee_id].append(record)
+            else:
+                record.theoretical_hours = 0
+        with instrument(self.env, "attendance.compute_theoretical_hours"):
+            for employee, records in records_by_employee.items():
+                dates = [record.check_in.date() for record in records]
+                hours = obj._theoretical_hours_batch(
+                    employee, min(dates), max(dates), cache=cache
+                )
+                for record in records:
+                    record.theoretical_hours = hours[
+                        (employee.id, record.check_in.date())
+                    ]
+
+    def _recompute_theoretical_hours(self):
+        """Recompute the stored theoretical hours of these attendances in
+        batch, instead of writing them one by one as calling the compute
+        method directly does.
+        """
+        self.env.add_to_compute(self._fields["theoretical_hours"], self)
+        self.flush(["theoretical_hours"])
+
+    def _get_theoretical_report_days(self):
+        """Get the days of the theoretical time report these attendances are
+        in, as a dictionary {employee: set of dates}.
+        """
+        dates_by_employee = defaultdict(set)
+        for record in self.filtered(lambda x: x.employee_id and x.check_in):
+            dates_by_employee[record.employee_id].add(record.check_in.date())
+        return dates_by_employee
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env["hr.attendance.theoretical.time.report"]._refresh_materialized_days(
+            records._get_theoretical_report_days()
+        )
+        return records
+
+    def write(self, vals):
+        """Refresh the materialized report and the balance on both the previous
+        and the new days of the attendances.
+        """
+        report = self.env["hr.attendance.theoretical.time.report"]
+        refresh = any(
+            field in vals for field in ("employee_id", "check_in", "check_out")
+        )
+        if refresh:
+            dates_by_employee = self._get_theoretical_report_days()
+        res = super().write(vals)
+        if refresh:
+            for employee, dates in self._get_theoretical_report_days().items():
+                dates_by_employee[employee] |= dates
+            report._refresh_materialized_days(dates_by_employee)
+        return res
+
+    def unlink(self):
+        dates_by_employee = self._get_theoretical_report_days()
+        res = super().unlink()
+        self.env["hr.attendance.theoretical.time.report"]._refresh_materialized_days(
+            dates_by_employee
+        )
+        return res
@@ -0,0 +1,202 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from collections import defaultdict
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+from odoo.tools import date_utils
+
+
+class HrAttendanceTheoreticalBalance(models.Model):
+    """Cumulative difference between the worked and the theoretical hours of
+    each employee at the end of the months, so that the balance at any date
+    is obtained from the previous checkpoint plus the days after it.
+    """
+
+    _name = "hr.attendance.theoretical.balance"
+    _description = "Monthly checkpoints of the theoretical time balance"
+    _order = "date,employee_id"
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee",
+        string="Employee",
+        required=True,
+        ondelete="cascade",
+    )
+    date = fields.Date(required=True, help="Last day of the month")
+    balance = fields.Float(
+        help="Difference between the worked and the theoretical hours since "
+        "the theoretical hours start date until this date, both included."
+    )
+
+    _sql_constraints = [
+        (
+            "employee_date_unique",
+            "UNIQUE(employee_id, date)",
+            "The balance can only be stored once per employee and date.",
+        )
+    ]
+
+    @api.model
+    def _invalidate(self, employees=None, date_from=None):
+        """Drop the checkpoints of the given employees that include the given
+        date, so that they are built again the next time they are needed.
+
+        :param: employees: Employees recordset. All of them if not given.
+        :param: date_from: First changed date. Unbounded if not given.
+        """
+        where = ["True"]
+        params = []
+        if employees is not None:
+            if not employees:
+                return
+            where.append("employee_id IN %s")
+            params.append(tuple(employees.ids))
+        if date_from:
+            where.append("date >= %s")
+            params.append(fields.Date.to_date(date_from))
+        self.flush()
+        self.env.cr.execute(
+            "DELETE FROM hr_attendance_theoretical_balance WHERE %s"
+            % " AND ".join(where),
+            params,
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _get_differences(self, dates_from, date_to):
+        """Sum the differences of the report per employee and month.
+
+        :param: dates_from: Dictionary {employee: first date}, the date being
+          None for not bounding the employee.
+        :param: date_to: Last date to sum.
+        :return: Dictionary {employee_id: {month start: difference}}.
+        """
+        res = defaultdict(dict)
+        # Employees with the same first date are read at once
+        employees_by_date = defaultdict(lambda: self.env["hr.employee"])
+        for employee, date_from in dates_from.items():
+            # Nothing counts before the theoretical hours start date
+            date_from = max(
+                filter(None, (date_from, employee.theoretical_hours_start_date)),
+                default=None,
+            )
+            if not date_from or date_from <= date_to:
+                employees_by_date[date_from] |= employee
+        for date_from, employees in employees_by_date.items():
+            report = (
+                self.env["hr.attendance.theoretical.time.report"]
+                .sudo()
+                .with_context(
+                    theoretical_date_from=fields.Date.to_string(date_from),
+                    theoretical_date_to=fields.Date.to_string(date_to),
+                )
+            )
+            domain = [("employee_id", "in", employees.ids), ("date", "<=", date_to)]
+            where = ["employee_id IN %s", "date <= %s"]
+            params = [tuple(employees.ids), date_to]
+            if date_from:
+                domain.append(("date", ">=", date_from))
+                where.append("date >= %s")
+                params.append(date_from)
+            if not report._is_materialized():
+                report._fill_theoretical_days(domain)
+            self.env.cr.execute(
+                """
+                SELECT employee_id, date_trunc('month', date)::date AS month,
+                    sum(difference)
+                FROM %s AS report
+                WHERE %s
+                GROUP BY employee_id, month
+                """
+                % (report._get_sql_source(), " AND ".join(where)),
+                params,
+            )
+            for employee_id, month, difference in self.env.cr.fetchall():
+                res[employee_id][month] = difference or 0.0
+        return res
+
+    @api.model
+    def _build(self, employees, date):
+        """Build the missing checkpoints of the employees up to the given last
+        day of a month, starting from their last valid checkpoint.
+
+        :return: Dictionary {employee_id: balance at the date}.
+        """
+        self.flush()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (employee_id) employee_id, date, balance
+            FROM hr_attendance_theoretical_balance
+            WHERE employee_id IN %s AND date <= %s
+            ORDER BY employee_id, date DESC
+            """,
+            (tuple(employees.ids), date),
+        )
+        last_checkpoints = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        res = {}
+        dates_from = {}
+        for employee in employees:
+            last_date, balance = last_checkpoints.get(employee.id, (None, 0.0))
+            if last_date == date:
+                res[employee.id] = balance
+            else:
+                dates_from[employee] = last_date and last_date + timedelta(days=1)
+        differences = self._get_differences(dates_from, date)
+        rows = []
+        now = fields.Datetime.now()
+        for employee in dates_from:
+            balance = last_checkpoints.get(employee.id, (None, 0.0))[1]
+            for month, difference in sorted(differences[employee.id].items()):
+                balance += difference
+                month_end = date_utils.end_of(month, "month")
+                if month_end < date:
+                    rows.append((employee.id, month_end, balance))
+            # Always store the requested checkpoint, even without any rows
+            rows.append((employee.id, date, balance))
+            res[employee.id] = balance
+        if rows:
+            execute_values(
+                self.env.cr,
+                """
+                INSERT INTO hr_attendance_theoretical_balance
+                    (employee_id, date, balance, create_uid, create_date,
+                     write_uid, write_date)
+                VALUES %s
+                ON CONFLICT (employee_id, date) DO NOTHING
+                """,
+                [row + (self.env.uid, now, self.env.uid, now) for row in rows],
+            )
+            self.invalidate_cache()
+        return res
+
+    @api.model
+    def _get_balances(self, employees, date=None):
+        """Get the balance of the employees at the given date, included, from
+        the last checkpoint before it plus the days of its month until the
+        date.
+
+        :param: employees: Employees recordset.
+        :param: date: Date of the balance. Today if not given.
+        :return: Dictionary {employee_id: balance}.
+        """
+        if not employees:
+            return {}
+        date = fields.Date.to_date(date) or fields.Date.context_today(self)
+        # Only completed months have checkpoints
+        checkpoint_date = date
+        if date_utils.end_of(date, "month") != date:
+            checkpoint_date = date_utils.start_of(date, "month") - timedelta(days=1)
+        today = fields.Date.context_today(self)
+        if checkpoint_date >= today:
+            checkpoint_date = date_utils.start_of(today, "month") - timedelta(days=1)
+        res = self._build(employees, checkpoint_date)
+        if checkpoint_date < date:
+            differences = self._get_differences(
+                dict.fromkeys(employees, checkpoint_date + timedelta(days=1)), date
+            )
+            for employee_id, months in differences.items():
+                res[employee_id] += sum(months.values())
+        return res
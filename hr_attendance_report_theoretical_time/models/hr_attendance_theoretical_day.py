@@ -0,0 +1,92 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+
+
+class HrAttendanceTheoreticalDay(models.Model):
+    _name = "hr.attendance.theoretical.day"
+    _description = "Theoretical hours per employee and day"
+    _order = "date,employee_id"
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee",
+        string="Employee",
+        required=True,
+        ondelete="cascade",
+        index=True,
+    )
+    date = fields.Date(required=True, index=True)
+    hours = fields.Float()
+
+    _sql_constraints = [
+        (
+            "employee_date_unique",
+            "UNIQUE(employee_id, date)",
+            "Theoretical hours can only be stored once per employee and day.",
+        )
+    ]
+
+    @api.model
+    def _store(self, values):
+        """Store the given theoretical hours, skipping the days that have been
+        stored meanwhile by a concurrent transaction.
+
+        :param: values: Dictionary {(employee_id, date): hours}.
+        """
+        if not values:
+            return
+        self.flush()
+        execute_values(
+            self.env.cr,
+            """
+            INSERT INTO hr_attendance_theoretical_day
+                (employee_id, date, hours, create_uid, create_date,
+                 write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (employee_id, date) DO NOTHING
+            """,
+            [
+                (
+                    employee_id,
+                    date,
+                    hours,
+                    self.env.uid,
+                    fields.Datetime.now(),
+                    self.env.uid,
+                    fields.Datetime.now(),
+                )
+                for (employee_id, date), hours in values.items()
+            ],
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _invalidate(self, employees=None, date_from=None, date_to=None):
+        """Drop the stored theoretical hours of the given employees and dates,
+        so that they are computed again the next time they are needed.
+
+        :param: employees: Employees recordset. All of them if not given.
+        :param: date_from: First date to drop. Unbounded if not given.
+        :param: date_to: Last date to drop. Unbounded if not given.
+        """
+        where = ["True"]
+        params = []
+        if employees is not None:
+            if not employees:
+                return
+            where.append("employee_id IN %s")
+            params.append(tuple(employees.ids))
+        if date_from:
+            where.append("date >= %s")
+            params.append(fields.Date.to_date(date_from))
+        if date_to:
+            where.append("date <= %s")
+            params.append(fields.Date.to_date(date_to))
+        self.flush()
+        self.env.cr.execute(
+            "DELETE FROM hr_attendance_theoretical_day WHERE %s" % " AND ".join(where),
+            params,
+        )
+        self.invalidate_cache()
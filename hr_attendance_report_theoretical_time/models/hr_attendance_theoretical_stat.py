@@ -0,0 +1,114 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Statistics of the current worker process, per database and phase
+_stats = defaultdict(
+    lambda: {"calls": 0, "queries": 0, "total_time": 0.0, "max_time": 0.0}
+)
+_stats_lock = threading.Lock()
+
+
+@contextmanager
+def instrument(env, phase):
+    """Measure the calls, SQL queries and elapsed time of a phase of the
+    theoretical time computations, logging it when it takes longer than the
+    seconds of the ``hr_attendance_report_theoretical_time.log_threshold``
+    system parameter.
+
+    :param: env: Environment whose cursor is measured.
+    :param: phase: Name of the phase.
+    """
+    threshold = float(
+        env["ir.config_parameter"]
+        .sudo()
+        .get_param("hr_attendance_report_theoretical_time.log_threshold", 0)
+    )
+    queries = env.cr.sql_log_count
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        queries = env.cr.sql_log_count - queries
+        with _stats_lock:
+            stat = _stats[(env.cr.dbname, phase)]
+            stat["calls"] += 1
+            stat["queries"] += queries
+            stat["total_time"] += elapsed
+            stat["max_time"] = max(stat["max_time"], elapsed)
+        if threshold and elapsed >= threshold:
+            _logger.info(
+                "Theoretical time %s on %s: %.3f s, %s queries",
+                phase,
+                env.cr.dbname,
+                elapsed,
+                queries,
+            )
+
+
+class HrAttendanceTheoreticalStat(models.TransientModel):
+    """Snapshot of the statistics of the theoretical time computations kept
+    in memory by the worker process serving the request.
+    """
+
+    _name = "hr.attendance.theoretical.stat"
+    _description = "Theoretical time computation statistics"
+    _order = "total_time desc"
+
+    pid = fields.Integer(string="Worker Process", readonly=True)
+    phase = fields.Char(readonly=True)
+    calls = fields.Integer(readonly=True)
+    queries = fields.Integer(string="SQL Queries", readonly=True)
+    total_time = fields.Float(string="Total Time (s)", readonly=True)
+    average_time = fields.Float(string="Average Time (s)", readonly=True)
+    max_time = fields.Float(string="Max Time (s)", readonly=True)
+
+    @api.model
+    def _take_snapshot(self):
+        """Store the statistics of the current worker and database."""
+        with _stats_lock:
+            stats = {
+                phase: dict(stat)
+                for (dbname, phase), stat in _stats.items()
+                if dbname == self.env.cr.dbname
+            }
+        return self.create(
+            [
+                {
+                    "pid": os.getpid(),
+                    "phase": phase,
+                    "calls": stat["calls"],
+                    "queries": stat["queries"],
+                    "total_time": stat["total_time"],
+                    "average_time": stat["total_time"] / (stat["calls"] or 1),
+                    "max_time": stat["max_time"],
+                }
+                for phase, stat in stats.items()
+            ]
+        )
+
+    @api.model
+    def action_view_snapshot(self):
+        records = self._take_snapshot()
+        action = self.env["ir.actions.act_window"]._for_xml_id(
+            "hr_attendance_report_theoretical_time.action_theoretical_stat"
+        )
+        action["domain"] = [("id", "in", records.ids)]
+        return action
+
+    @api.model
+    def action_reset(self):
+        """Reset the statistics of the current worker and database."""
+        with _stats_lock:
+            for key in [key for key in _stats if key[0] == self.env.cr.dbname]:
+                del _stats[key]
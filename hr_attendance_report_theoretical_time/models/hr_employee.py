@@ -1,7 +1,9 @@
 # Copyright 2018 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from datetime import datetime, time
+
+from odoo import api, fields, models
 
 
 class HrEmployee(models.Model):
@@ -13,3 +15,83 @@ class HrEmployee(models.Model):
         "not filled, employee creation date or the calendar start date "
         "will be used (the greatest of both)."
     )
+    theoretical_balance = fields.Float(
+        string="Overtime Balance",
+        compute="_compute_theoretical_balance",
+        help="Difference between the worked and the theoretical hours since "
+        "the theoretical hours start date until today.",
+    )
+
+    @api.depends_context("theoretical_balance_date")
+    def _compute_theoretical_balance(self):
+        """Get the balance at the date given in the context, today if none."""
+        balances = self.env["hr.attendance.theoretical.balance"].sudo()._get_balances(
+            self.sudo().filtered("id"), self.env.context.get("theoretical_balance_date")
+        )
+        for record in self:
+            record.theoretical_balance = balances.get(record.id, 0.0)
+
+    def _enqueue_theoretical_recompute(
+        self, date_from=None, date_to=None, weekdays=None, week_types=None
+    ):
+        """Enqueue the recomputation of the theoretical hours of these
+        employees, which also refreshes their stored theoretical days,
+        materialized rows, totals per period and balance checkpoints.
+
+        :param: date_from: First date to recompute. It's never before the first
+          attendance or stored theoretical day of the employees.
+        :param: date_to: Last date to recompute. Today if not given.
+        :param: weekdays: Days of the week to recompute. All of them if not given.
+        :param: week_types: Week types to recompute. All of them if not given.
+        """
+        if not self:
+            return
+        self.env["hr.attendance"].flush(["employee_id", "check_in"])
+        self.env["hr.attendance.theoretical.day"].flush(["employee_id", "date"])
+        self.env.cr.execute(
+            """
+            SELECT LEAST(
+                (SELECT MIN(check_in)::date FROM hr_attendance
+                 WHERE employee_id IN %(employee_ids)s),
+                (SELECT MIN(date) FROM hr_attendance_theoretical_day
+                 WHERE employee_id IN %(employee_ids)s)
+            )
+            """,
+            {"employee_ids": tuple(self.ids)},
+        )
+        first_date = self.env.cr.fetchone()[0]
+        if not first_date:
+            return
+        date_from = max(date_from or first_date, first_date)
+        date_to = date_to or fields.Date.context_today(self)
+        if date_from > date_to:
+            return
+        self.env["recompute.theoretical.attendance.job"]._enqueue(
+            self,
+            datetime.combine(date_from, time.min),
+            datetime.combine(date_to, time.max).replace(microsecond=0),
+            weekdays=weekdays,
+            week_types=week_types,
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env["hr.attendance.theoretical.time.report"]._refresh_materialized(
+            employees=records
+        )
+        return records
+
+    def write(self, vals):
+        calendar_changed = self.browse()
+        if "resource_calendar_id" in vals:
+            calendar_changed = self.filtered(
+                lambda x: x.resource_calendar_id.id != vals["resource_calendar_id"]
+            )
+        res = super().write(vals)
+        report = self.env["hr.attendance.theoretical.time.report"]
+        if "department_id" in vals or "theoretical_hours_start_date" in vals:
+            report._refresh_materialized(employees=self)
+        # The working calendar applies to the whole history of the employee
+        calendar_changed._enqueue_theoretical_recompute()
+        return res
@@ -1,7 +1,7 @@
 # Copyright 2018 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class HrEmployeePublic(models.Model):
@@ -13,3 +13,24 @@ class HrEmployeePublic(models.Model):
         "not filled, employee creation date or the calendar start date "
         "will be used (the greatest of both)."
     )
+    theoretical_balance = fields.Float(
+        string="Overtime Balance",
+        compute="_compute_theoretical_balance",
+        groups="hr_attendance.group_hr_attendance",
+        help="Difference between the worked and the theoretical hours since "
+        "the theoretical hours start date until today.",
+    )
+
+    @api.depends_context("theoretical_balance_date")
+    def _compute_theoretical_balance(self):
+        """Show the balance of the own employee, or of everyone for the users
+        that can see the attendances of everyone, as the report does.
+        """
+        employees = self.env["hr.employee"].sudo().browse(self.filtered("id").ids)
+        if not self.env.user.has_group("hr_attendance.group_hr_attendance_user"):
+            employees = employees.filtered(lambda x: x.user_id == self.env.user)
+        balances = self.env["hr.attendance.theoretical.balance"].sudo()._get_balances(
+            employees, self.env.context.get("theoretical_balance_date")
+        )
+        for record in self:
+            record.theoretical_balance = balances.get(record.id, 0.0)
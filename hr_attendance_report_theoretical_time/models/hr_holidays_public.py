@@ -1,52 +1,110 @@
 # Copyright 2017-2019 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from datetime import datetime, time
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
-from odoo import api, fields, models
+from odoo import api, models
+from odoo.osv import expression
+
+from ..reports.hr_attendance_theoretical_time_report import TheoreticalHoursCache
 
 
 class HrHolidaysPublicLine(models.Model):
     _inherit = "hr.holidays.public.line"
 
+    def _get_theoretical_scopes(self):
+        """Get the dates of the lines grouped by the employees they apply to.
+
+        :return: Dictionary {(country_id, state_ids): set of dates}.
+        """
+        scopes = defaultdict(set)
+        for record in self.filtered("date"):
+            key = (record.year_id.country_id.id, tuple(record.state_ids.ids))
+            scopes[key].add(record.date)
+        return scopes
+
     @api.model
-    def _check_theoretical_hours(self, date):
-        """Recomputes all the theoretical hours that corresponds to the date
-        of the public holiday.
+    def _check_theoretical_hours_scopes(self, scopes):
+        """Recomputes in one go all the theoretical hours that corresponds to
+        the dates of the public holidays, only for the employees whose address
+        country and state are the ones of the holidays.
 
-        :param: date: Date for recomputing attendances.
+        :param: scopes: Dictionary {(country_id, state_ids): set of dates}.
         """
-        if not date:
+        domains = []
+        to_invalidate = []
+        for (country_id, state_ids), dates in scopes.items():
+            employee_domain = []
+            if country_id:
+                employee_domain.append(("address_id.country_id", "=", country_id))
+            if state_ids:
+                employee_domain.append(("address_id.state_id", "in", state_ids))
+            employees = None
+            if employee_domain:
+                employees = (
+                    self.env["hr.employee"]
+                    .with_context(active_test=False)
+                    .search(employee_domain)
+                )
+                if not employees:
+                    continue
+            date_domains = []
+            for date in dates:
+                from_datetime = datetime.combine(date, time.min)
+                to_datetime = from_datetime + timedelta(days=1)
+                date_domains.append(
+                    [("check_in", ">=", from_datetime), ("check_in", "<", to_datetime)]
+                )
+            domain = expression.OR(date_domains)
+            if employees is not None:
+                domain = expression.AND(
+                    [[("employee_id", "in", employees.ids)], domain]
+                )
+            domains.append(domain)
+            # Invalidated at once over the dates covering the whole scope
+            to_invalidate.append((employees, min(dates), max(dates)))
+        if not domains:
             return
-        if isinstance(date, str):
-            date = fields.Date.from_string(date)
-        from_datetime = datetime.combine(date, time(0, 0, 0, 0))
-        to_datetime = datetime.combine(date, time(23, 59, 59, 99999))
-        records = self.env["hr.attendance"].search(
-            [
-                ("check_in", ">=", fields.Datetime.to_string(from_datetime)),
-                ("check_in", "<=", fields.Datetime.to_string(to_datetime)),
-            ]
-        )
-        records._compute_theoretical_hours()
+        # Share the computed days between the attendances and the report
+        self = self.with_context(theoretical_cache=TheoreticalHoursCache())
+        self.env["hr.attendance"].search(
+            expression.OR(domains)
+        )._recompute_theoretical_hours()
+        report = self.env["hr.attendance.theoretical.time.report"]
+        for employees, date_from, date_to in to_invalidate:
+            report._invalidate_theoretical_hours(employees, date_from, date_to)
+
+    def _check_theoretical_hours(self):
+        """Recomputes all the theoretical hours that corresponds to the dates
+        of these public holiday lines.
+        """
+        self._check_theoretical_hours_scopes(self._get_theoretical_scopes())
 
     @api.model_create_multi
     def create(self, vals_list):
         """Trigger recomputation for the date of the new lines."""
         records = super().create(vals_list)
-        for record in records:
-            self._check_theoretical_hours(record.date)
+        records._check_theoretical_hours()
         return records
 
     def write(self, vals):
-        """If the date of a line is changed, we first recompute hours of the
-        previous date, and then the theoretical hours of the current date.
+        """If the date or the states of a line are changed, we recompute the
+        theoretical hours of both the previous and the current dates.
         """
-        if "date" in vals:
-            dates = set(self.mapped("date"))
-            dates.add(vals["date"])
+        recompute = "date" in vals or "state_ids" in vals
+        if recompute:
+            scopes = self._get_theoretical_scopes()
         res = super().write(vals)
-        if "date" in vals:
-            for date in dates:
-                self._check_theoretical_hours(date=date)
+        if recompute:
+            for key, dates in self._get_theoretical_scopes().items():
+                scopes[key] |= dates
+            self._check_theoretical_hours_scopes(scopes)
+        return res
+
+    def unlink(self):
+        """Trigger recomputation for the date of the removed lines."""
+        scopes = self._get_theoretical_scopes()
+        res = super().unlink()
+        self._check_theoretical_hours_scopes(scopes)
         return res
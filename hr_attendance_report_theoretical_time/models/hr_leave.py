@@ -1,7 +1,15 @@
 # Copyright 2017-2019 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import pytz
+
 from odoo import models
+from odoo.osv import expression
+
+from ..reports.hr_attendance_theoretical_time_report import TheoreticalHoursCache
 
 
 class HrLeave(models.Model):
@@ -21,25 +29,71 @@ class HrLeave(models.Model):
         self._check_theoretical_hours()
         return res
 
+    def _get_theoretical_date_ranges(self):
+        """Get the days covered by the leaves in the timezone of the working
+        calendar of their employees, merging the overlapping or contiguous
+        ones.
+
+        :return: Dictionary {employee: [(date_from, date_to)]}.
+        """
+        ranges = defaultdict(list)
+        for record in self.filtered(
+            lambda x: x.employee_id and x.date_from and x.date_to
+        ):
+            employee = record.employee_id
+            tz = pytz.timezone(employee.resource_calendar_id.tz or employee.tz or "UTC")
+            ranges[employee].append(
+                (
+                    pytz.utc.localize(record.date_from).astimezone(tz).date(),
+                    pytz.utc.localize(record.date_to).astimezone(tz).date(),
+                )
+            )
+        res = {}
+        for employee, employee_ranges in ranges.items():
+            merged = []
+            for date_from, date_to in sorted(employee_ranges):
+                if merged and date_from <= merged[-1][1] + timedelta(days=1):
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], date_to))
+                else:
+                    merged.append((date_from, date_to))
+            res[employee] = merged
+        return res
+
     def _check_theoretical_hours(self):
         """Recomputes all the theoretical hours that corresponds to the
-        interval of dates and employee of the leaves.
+        interval of dates and employee of the leaves, searching all the
+        involved attendances at once.
 
         :param: self: Leave recordset.
         """
-        to_recompute = self.env["hr.attendance"]
-        for record in self.filtered(lambda x: x.date_from and x.date_to):
-            from_datetime = record.date_from.replace(
-                hour=0, minute=0, second=0, microsecond=0
-            )
-            to_datetime = record.date_to.replace(
-                hour=23, minute=59, second=59, microsecond=99999
-            )
-            to_recompute |= self.env["hr.attendance"].search(
-                [
-                    ("employee_id", "=", record.employee_id.id),
-                    ("check_in", ">=", from_datetime),
-                    ("check_in", "<=", to_datetime),
-                ]
-            )
-        to_recompute._compute_theoretical_hours()
+        ranges = self._get_theoretical_date_ranges()
+        domains = []
+        for employee, employee_ranges in ranges.items():
+            for date_from, date_to in employee_ranges:
+                # Theoretical hours of attendances are computed for the date
+                # of their check-in
+                domains.append(
+                    [
+                        ("employee_id", "=", employee.id),
+                        ("check_in", ">=", datetime.combine(date_from, time.min)),
+                        (
+                            "check_in",
+                            "<",
+                            datetime.combine(date_to + timedelta(days=1), time.min),
+                        ),
+                    ]
+                )
+        if not domains:
+            return
+        # Share the computed days between the attendances and the report
+        self = self.with_context(theoretical_cache=TheoreticalHoursCache())
+        self.env["hr.attendance"].search(
+            expression.OR(domains)
+        )._recompute_theoretical_hours()
+        # Invalidated at once over the dates covering all the leaves
+        all_ranges = [x for employee_ranges in ranges.values() for x in employee_ranges]
+        self.env["hr.attendance.theoretical.time.report"]._invalidate_theoretical_hours(
+            self.env["hr.employee"].union(*ranges),
+            min(date_from for date_from, __ in all_ranges),
+            max(date_to for __, date_to in all_ranges),
+        )
@@ -12,3 +12,14 @@ class HrLeaveType(models.Model):
         help="If you check this mark, leaves in this category won't reduce "
         "the number of theoretical hours in the attendance report.",
     )
+
+    def write(self, vals):
+        """Recompute the theoretical hours of the validated leaves of these
+        types when they start or stop counting as theoretical time.
+        """
+        res = super().write(vals)
+        if "include_in_theoretical" in vals:
+            self.env["hr.leave"].search(
+                [("holiday_status_id", "in", self.ids), ("state", "=", "validate")]
+            )._check_theoretical_hours()
+        return res
@@ -0,0 +1,261 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+
+from ..reports.hr_attendance_theoretical_time_report import TheoreticalHoursCache
+from .hr_attendance_theoretical_stat import instrument
+
+_logger = logging.getLogger(__name__)
+
+
+class RecomputeTheoreticalAttendanceJob(models.Model):
+    """Recomputation of the theoretical hours of the attendances of several
+    employees and dates, done in background by a cron in chunks of one
+    employee and one month, each one committed on its own.
+    """
+
+    _name = "recompute.theoretical.attendance.job"
+    _description = "Recompute Employees Attendances Job"
+    _order = "id desc"
+
+    employee_ids = fields.Many2many(
+        comodel_name="hr.employee",
+        relation="recompute_theoretical_attendance_job_employee_rel",
+        string="Employees",
+        readonly=True,
+    )
+    pending_employee_ids = fields.Many2many(
+        comodel_name="hr.employee",
+        relation="recompute_theoretical_attendance_job_pending_employee_rel",
+        string="Pending Employees",
+        readonly=True,
+    )
+    date_from = fields.Datetime(string="From", required=True, readonly=True)
+    date_to = fields.Datetime(string="To", required=True, readonly=True)
+    cursor_date = fields.Datetime(
+        readonly=True,
+        help="Date from which the attendances of the first pending employee "
+        "are still to be recomputed",
+    )
+    weekdays = fields.Char(
+        readonly=True,
+        help="Comma-separated days of the week (0 for Monday) of the attendances "
+        "to recompute. All of them if empty",
+    )
+    week_types = fields.Char(
+        readonly=True,
+        help="Comma-separated week types (0 for the first week, 1 for the second "
+        "one) of the attendances to recompute, for two weeks calendars. All of "
+        "them if empty",
+    )
+    state = fields.Selection(
+        selection=[("pending", "Pending"), ("done", "Done")],
+        default="pending",
+        required=True,
+        readonly=True,
+    )
+    progress = fields.Float(compute="_compute_progress")
+
+    @api.depends("employee_ids", "pending_employee_ids")
+    def _compute_progress(self):
+        for record in self:
+            total = len(record.employee_ids)
+            done = total - len(record.pending_employee_ids)
+            record.progress = 100.0 * done / total if total else 100.0
+
+    @api.model
+    def _enqueue(self, employees, date_from, date_to, weekdays=None, week_types=None):
+        """Create a job and wake up the cron that processes it.
+
+        :param: weekdays: Iterable of days of the week (0 for Monday) to restrict
+          the recomputation to. All of them if not given.
+        :param: week_types: Iterable of week types (0 or 1) to restrict the
+          recomputation to. All of them if not given.
+        """
+        if weekdays:
+            weekdays = ",".join(map(str, sorted(set(weekdays))))
+        if week_types:
+            week_types = ",".join(map(str, sorted(set(week_types))))
+        job = self.create(
+            {
+                "employee_ids": [(6, 0, employees.ids)],
+                "pending_employee_ids": [(6, 0, employees.ids)],
+                "date_from": date_from,
+                "date_to": date_to,
+                "weekdays": weekdays or False,
+                "week_types": week_types or False,
+            }
+        )
+        self.env.ref(
+            "hr_attendance_report_theoretical_time."
+            "ir_cron_recompute_theoretical_attendance"
+        )._trigger()
+        return job
+
+    def _process_chunk(self):
+        """Recompute the attendances of the first pending employee for the
+        month starting on the cursor date, and move the cursor forward.
+        """
+        self.ensure_one()
+        # The chunk is committed on its own, so its computations share a cache
+        # of theoretical hours that is not kept for the next chunks
+        self = self.with_context(theoretical_cache=TheoreticalHoursCache())
+        employee = self.pending_employee_ids[:1]
+        chunk_from = self.cursor_date or self.date_from
+        chunk_to = (chunk_from + relativedelta(months=1)).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        domain = [
+            ("employee_id", "=", employee.id),
+            ("check_in", ">=", chunk_from),
+        ]
+        if chunk_to > self.date_to:
+            domain.append(("check_in", "<=", self.date_to))
+            last_date = self.date_to.date()
+        else:
+            domain.append(("check_in", "<", chunk_to))
+            last_date = (chunk_to - relativedelta(days=1)).date()
+        attendances = self.env["hr.attendance"].search(domain)
+        if self.weekdays:
+            weekdays = [int(x) for x in self.weekdays.split(",")]
+            attendances = attendances.filtered(
+                lambda x: x.check_in.weekday() in weekdays
+            )
+        if self.week_types:
+            week_types = [int(x) for x in self.week_types.split(",")]
+            get_week_type = self.env["resource.calendar.attendance"].get_week_type
+            attendances = attendances.filtered(
+                lambda x: get_week_type(x.check_in.date()) in week_types
+            )
+        attendances._recompute_theoretical_hours()
+        self.env["hr.attendance.theoretical.time.report"]._invalidate_theoretical_hours(
+            employee, chunk_from.date(), last_date
+        )
+        if chunk_to > self.date_to:
+            self.write(
+                {"pending_employee_ids": [(3, employee.id)], "cursor_date": False}
+            )
+            if not self.pending_employee_ids:
+                self.state = "done"
+        else:
+            self.cursor_date = chunk_to
+
+    def _process(self, deadline=None):
+        """Process chunks until the job is done or the deadline is reached,
+        committing after each chunk so that an interrupted job resumes from
+        the last processed one.
+
+        :return: True if the job has been completely processed.
+        """
+        self.ensure_one()
+        while self.state == "pending":
+            if not self.pending_employee_ids:
+                self.state = "done"
+                break
+            if deadline and time.time() > deadline:
+                return False
+            with instrument(self.env, "recompute.chunk"):
+                self._process_chunk()
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        return True
+
+    @api.model
+    def _cron_process(self, time_limit=60):
+        """Process the pending jobs, re-triggering the cron if there are still
+        chunks to be processed when the time limit is reached.
+        """
+        deadline = time.time() + time_limit
+        for job in self.search([("state", "=", "pending")], order="id"):
+            if not job._process(deadline=deadline):
+                _logger.info(
+                    "Theoretical hours recomputation %s will be resumed", job.id
+                )
+                self.env.ref(
+                    "hr_attendance_report_theoretical_time."
+                    "ir_cron_recompute_theoretical_attendance"
+                )._trigger()
+                break
+
+    @api.model
+    def _get_partitions(self, chunk_size=50, company_ids=None):
+        """Split the employees with attendances in partitions of at most the
+        given number of employees of the same company, for recomputing them
+        in parallel.
+
+        :param: company_ids: Ids of the companies to include. All if not given.
+        :return: List of tuples (company_id, employee ids).
+        """
+        self.env["hr.attendance"].flush(["employee_id"])
+        self.env["hr.employee"].flush(["company_id"])
+        where = "True"
+        params = []
+        if company_ids:
+            where = "he.company_id IN %s"
+            params.append(tuple(company_ids))
+        self.env.cr.execute(
+            """
+            SELECT he.company_id, array_agg(he.id ORDER BY he.id)
+            FROM hr_employee he
+            WHERE EXISTS (
+                SELECT 1 FROM hr_attendance ha WHERE ha.employee_id = he.id
+            ) AND %s
+            GROUP BY he.company_id
+            ORDER BY he.company_id
+            """
+            % where,
+            params,
+        )
+        return [
+            (company_id, employee_ids[i : i + chunk_size])
+            for company_id, employee_ids in self.env.cr.fetchall()
+            for i in range(0, len(employee_ids), chunk_size)
+        ]
+
+    @api.model
+    def _recompute_partition(self, employee_ids, date_from=None, date_to=None):
+        """Recompute the theoretical hours of the attendances of the given
+        employees, one employee at a time.
+
+        :param: employee_ids: Ids of the employees.
+        :param: date_from: First date to recompute. Unbounded if not given.
+        :param: date_to: Last date to recompute. Unbounded if not given.
+        :return: Number of recomputed attendances.
+        """
+        self = self.with_context(theoretical_cache=TheoreticalHoursCache())
+        employees = (
+            self.env["hr.employee"].with_context(active_test=False).browse(employee_ids)
+        )
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        check_in_domain = []
+        if date_from:
+            check_in_domain.append(
+                ("check_in", ">=", datetime.combine(date_from, datetime.min.time()))
+            )
+        if date_to:
+            check_in_domain.append(
+                (
+                    "check_in",
+                    "<",
+                    datetime.combine(date_to + timedelta(days=1), datetime.min.time()),
+                )
+            )
+        count = 0
+        for employee in employees:
+            domain = [("employee_id", "=", employee.id)] + check_in_domain
+            attendances = self.env["hr.attendance"].search(domain)
+            attendances._recompute_theoretical_hours()
+            attendances.invalidate_cache()
+            count += len(attendances)
+        self.env["hr.attendance.theoretical.time.report"]._invalidate_theoretical_hours(
+            employees, date_from, date_to
+        )
+        return count
@@ -0,0 +1,49 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    theoretical_time_report_materialized = fields.Boolean(
+        string="Materialized theoretical time report",
+        config_parameter="hr_attendance_report_theoretical_time.materialized",
+        help="Store the rows of the theoretical vs attended time report, "
+        "refreshing them when attendances, leaves, public holidays or working "
+        "schedules change, instead of generating them on each reading.",
+    )
+    theoretical_time_report_rollups = fields.Boolean(
+        string="Theoretical time totals per period",
+        help="Store the totals of the theoretical vs attended time report per "
+        "employee and week, month and year, which are read instead of the "
+        "report rows when grouping by those periods.",
+    )
+
+    @api.model
+    def get_values(self):
+        res = super().get_values()
+        res["theoretical_time_report_rollups"] = (
+            self.env["hr.attendance.theoretical.time.rollup"].sudo()._is_enabled()
+        )
+        return res
+
+    def set_values(self):
+        """Build the materialized report or the totals per period when
+        enabling them, and drop them when disabling them.
+        """
+        report = self.env["hr.attendance.theoretical.time.report"]
+        was_materialized = report._is_materialized()
+        res = super().set_values()
+        if self.theoretical_time_report_materialized and not was_materialized:
+            report.action_refresh_materialized()
+        elif not self.theoretical_time_report_materialized and was_materialized:
+            self.env.cr.execute(
+                "DELETE FROM hr_attendance_theoretical_time_report_store"
+            )
+        rollup = self.env["hr.attendance.theoretical.time.rollup"].sudo()
+        if self.theoretical_time_report_rollups and not rollup._is_enabled():
+            rollup._rebuild()
+        elif not self.theoretical_time_report_rollups and rollup._is_enabled():
+            rollup._clear()
+        return res
@@ -0,0 +1,117 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class ResourceCalendar(models.Model):
+    _inherit = "resource.calendar"
+
+    def _enqueue_theoretical_recompute(
+        self, date_from=None, date_to=None, weekdays=None, week_types=None
+    ):
+        """Enqueue the recomputation of the theoretical hours of the employees
+        working with these calendars.
+
+        :param: date_from: First date to recompute. It's never before the first
+          attendance or stored theoretical day of the employees.
+        :param: date_to: Last date to recompute. Today if not given.
+        :param: weekdays: Days of the week to recompute. All of them if not given.
+        :param: week_types: Week types to recompute. All of them if not given.
+        """
+        self.env["hr.employee"].with_context(active_test=False).search(
+            [("resource_calendar_id", "in", self.ids)]
+        )._enqueue_theoretical_recompute(
+            date_from=date_from,
+            date_to=date_to,
+            weekdays=weekdays,
+            week_types=week_types,
+        )
+
+    def write(self, vals):
+        """Recompute everything for the calendars whose timezone or kind of
+        weeks is changed."""
+        to_recompute = self.filtered(
+            lambda x: any(
+                field in vals and x[field] != vals[field]
+                for field in ("tz", "two_weeks_calendar")
+            )
+        )
+        res = super().write(vals)
+        if to_recompute:
+            for record in to_recompute:
+                record._enqueue_theoretical_recompute()
+        return res
+
+
+class ResourceCalendarAttendance(models.Model):
+    _inherit = "resource.calendar.attendance"
+
+    _theoretical_fields = {
+        "calendar_id",
+        "date_from",
+        "date_to",
+        "dayofweek",
+        "hour_from",
+        "hour_to",
+        "resource_id",
+        "week_type",
+    }
+
+    def _get_theoretical_scopes(self, scopes=None):
+        """Get the dates affected by these lines, grouped by calendar.
+
+        :param: scopes: Scopes to extend with the ones of these lines.
+        :return: Dictionary {calendar: (date_from, date_to, weekdays,
+          week_types)}, where an empty value means no restriction.
+        """
+        scopes = dict(scopes or {})
+        for record in self.filtered("calendar_id"):
+            calendar = record.calendar_id
+            date_from = record.date_from
+            date_to = record.date_to
+            weekdays = {int(record.dayofweek)}
+            week_types = None
+            if calendar.two_weeks_calendar and record.week_type:
+                week_types = {int(record.week_type)}
+            if calendar in scopes:
+                old_from, old_to, old_weekdays, old_week_types = scopes[calendar]
+                date_from = date_from and old_from and min(date_from, old_from)
+                date_to = date_to and old_to and max(date_to, old_to)
+                weekdays |= old_weekdays
+                if week_types and old_week_types:
+                    week_types |= old_week_types
+                else:
+                    week_types = None
+            scopes[calendar] = (date_from, date_to, weekdays, week_types)
+        return scopes
+
+    @api.model
+    def _enqueue_theoretical_recompute(self, scopes):
+        for calendar, (date_from, date_to, weekdays, week_types) in scopes.items():
+            calendar._enqueue_theoretical_recompute(
+                date_from=date_from,
+                date_to=date_to,
+                weekdays=weekdays,
+                week_types=week_types,
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self._enqueue_theoretical_recompute(records._get_theoretical_scopes())
+        return records
+
+    def write(self, vals):
+        recompute = bool(self._theoretical_fields & set(vals))
+        if recompute:
+            scopes = self._get_theoretical_scopes()
+        res = super().write(vals)
+        if recompute:
+            self._enqueue_theoretical_recompute(self._get_theoretical_scopes(scopes))
+        return res
+
+    def unlink(self):
+        scopes = self._get_theoretical_scopes()
+        res = super().unlink()
+        self._enqueue_theoretical_recompute(scopes)
+        return res
@@ -2,3 +2,5 @@
 
 from . import hr_attendance_report
 from . import hr_attendance_theoretical_time_report
+from . import hr_attendance_theoretical_time_report_store
+from . import hr_attendance_theoretical_time_rollup
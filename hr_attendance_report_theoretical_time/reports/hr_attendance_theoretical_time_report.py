@@ -2,12 +2,56 @@
 # Copyright 2021 Tecnativa - Víctor Martínez
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from datetime import datetime, time
+import csv
+import io
+import tempfile
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
 import pytz
+import xlsxwriter
 from psycopg2.extensions import AsIs
 
-from odoo import api, fields, models, tools
+from odoo import _, api, fields, models, tools
+from odoo.osv import expression
+from odoo.tools import date_utils
+
+from ..models.hr_attendance_theoretical_stat import instrument
+from .hr_attendance_theoretical_time_rollup import PERIOD_TYPES
+
+
+class TheoreticalHoursCache:
+    """Values reused by the computations of theoretical hours done in the same
+    transaction: timezones, working calendars of the employees with the
+    context for their public holidays, and the hours of the days already
+    computed, so that asking again for them is just a dictionary lookup.
+
+    It's passed down by the callers through the ``theoretical_cache`` context
+    key, and it must not outlive changes on leaves, public holidays or working
+    calendars.
+    """
+
+    def __init__(self):
+        self.timezones = {}
+        self.calendars = {}
+        self.day_hours = defaultdict(dict)
+
+    def get_timezone(self, name):
+        if name not in self.timezones:
+            self.timezones[name] = pytz.timezone(name or "UTC")
+        return self.timezones[name]
+
+    def get_calendar(self, employee):
+        """Get the working calendar of the employee and its timezone."""
+        if employee.id not in self.calendars:
+            calendar = employee.resource_id.calendar_id
+            self.calendars[employee.id] = (
+                calendar.with_context(
+                    exclude_public_holidays=True, employee_id=employee.id
+                ),
+                self.get_timezone(calendar.tz),
+            )
+        return self.calendars[employee.id]
 
 
 class HrAttendanceTheoreticalTimeReport(models.Model):
@@ -32,8 +76,8 @@ class HrAttendanceTheoreticalTimeReport(models.Model):
 
     def _select(self):
         # We put "max" aggregation function for theoretical hours because
-        # we will recompute for other detail levels different than day
-        # through recursivity by day results and will aggregate them manually
+        # all the attendances of the same day and the generated day carry
+        # the theoretical hours of the whole day
         return """
             min(id) AS id,
             employee_id,
@@ -41,17 +85,15 @@ class HrAttendanceTheoreticalTimeReport(models.Model):
             date,
             sum(worked_hours) AS worked_hours,
             max(theoretical_hours) AS theoretical_hours,
-            sum(difference) AS difference
+            sum(worked_hours) - max(theoretical_hours) AS difference
             """
 
     def _select_sub1(self):
-        # Unique ID is assured (mostly, as we lose some precission) through
-        # this MD5 hash converted to integer. See
-        # https://stackoverflow.com/a/9812029 for details.
+        # Unique ID is assured by packing the source of the row in the lowest
+        # bit of the ID: even IDs come from the attendances, being the
+        # attendance ID shifted, and odd ones from the generated days.
         return """
-            (
-                ('x'||substr(MD5('HA' || ha.id::text), 1, 8))::bit(32)::int
-            ) AS id,
+            ha.id::bigint << 1 AS id,
             ha.employee_id AS employee_id,
             hahe.department_id AS department_id,
             ha.check_in::date AS date,
@@ -67,28 +109,40 @@ class HrAttendanceTheoreticalTimeReport(models.Model):
             """
 
     def _where_sub1(self):
-        return "True"
+        where = ["True"]
+        date_from, date_to = self._get_sql_date_bounds()
+        if date_from:
+            where.append("ha.check_in::date >= %s" % date_from)
+        if date_to:
+            where.append("ha.check_in::date <= %s" % date_to)
+        return " AND ".join(where)
 
     def _select_sub2(self):
-        # Same comment about ID uniqueness of sub1.
+        # Same comment about ID uniqueness of sub1. Over the source bit, the
+        # ID packs the employee ID and the number of days since 0001-01-01,
+        # which fits in 21 bits until year 5741.
         return """
             (
-                ('x'||substr(MD5(
-                    'HE' || he.id::text || gs::text
-                ), 1, 8))::bit(32)::int
-            ) AS id,
+                ((he.id::bigint << 21) | (gs::date - date '0001-01-01')) << 1
+            ) | 1 AS id,
             he.id AS employee_id,
             he.department_id AS department_id,
             gs::date AS date,
             0 AS worked_hours,
-            -1 AS theoretical_hours,
+            COALESCE(htd.hours, -1) AS theoretical_hours,
             0.0 AS difference
             """
 
     def _from_sub2(self):
+        # The modulo is computed with mod() rather than the % operator, so
+        # that the query can be run with and without parameters alike.
         # We generate one record for each of the theoretical working days
         # since the employee creation / working schedule beginning for not
-        # depending on the registered attendances.
+        # depending on the registered attendances. Their theoretical hours
+        # are taken from the stored ones, being -1 if not computed yet.
+        # When the report is read for a range of dates, the series are also
+        # restricted to it.
+        date_from, date_to = self._get_sql_date_bounds()
         return """
                 hr_employee he
             INNER JOIN
@@ -103,28 +157,34 @@ class HrAttendanceTheoreticalTimeReport(models.Model):
                                  he.create_date::date),
                         COALESCE(rca.date_from,
                                  he.theoretical_hours_start_date,
-                                 he.create_date::date)
+                                 he.create_date::date){date_from}
                     )
-                    + (8 + rca.dayofweek::int -
+                    + mod(8 + rca.dayofweek::int -
                         extract(dow from greatest(
                             COALESCE(he.theoretical_hours_start_date,
                                      he.create_date::date),
                             COALESCE(rca.date_from,
                                      he.theoretical_hours_start_date,
-                                     he.create_date::date)
-                        ))::int) % 7,
+                                     he.create_date::date){date_from}
+                        ))::int, 7),
                     least(
                         COALESCE(rca.date_to, current_date),
-                        current_date
+                        current_date{date_to}
                     )
-                    + (-6 + rca.dayofweek::int -
+                    + mod(-6 + rca.dayofweek::int -
                         extract(dow from least(
                             COALESCE(rca.date_to, current_date),
-                            current_date
-                        ))::int) % 7,
+                            current_date{date_to}
+                        ))::int, 7),
                     '7 days'
                 ) AS gs
-            """
+            LEFT JOIN
+                hr_attendance_theoretical_day htd
+                    ON htd.employee_id = he.id AND htd.date = gs::date
+            """.format(
+            date_from=", %s" % date_from if date_from else "",
+            date_to=", %s" % date_to if date_to else "",
+        )
 
     def _where_sub2(self):
         return """
@@ -138,11 +198,8 @@ class HrAttendanceTheoreticalTimeReport(models.Model):
             date
             """
 
-    def init(self):
-        tools.drop_view_if_exists(self.env.cr, self._table)
-        self.env.cr.execute(
-            """
-CREATE or REPLACE VIEW %s as (
+    def _query(self):
+        return """
     SELECT %s
     FROM (
         (
@@ -157,90 +214,652 @@ CREATE or REPLACE VIEW %s as (
         )
     ) AS u
     GROUP BY %s
-)
-            """,
-            (
-                AsIs(self._table),
-                AsIs(self._select()),
-                AsIs(self._select_sub1()),
-                AsIs(self._from_sub1()),
-                AsIs(self._where_sub1()),
-                AsIs(self._select_sub2()),
-                AsIs(self._from_sub2()),
-                AsIs(self._where_sub2()),
-                AsIs(self._group_by()),
-            ),
+            """ % (
+            self._select(),
+            self._select_sub1(),
+            self._from_sub1(),
+            self._where_sub1(),
+            self._select_sub2(),
+            self._from_sub2(),
+            self._where_sub2(),
+            self._group_by(),
         )
 
-    # TODO: To be activated for performance assuring cache clearing on changes
-    # @tools.ormcache('employee.id', 'date')
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(
+            "CREATE or REPLACE VIEW %s as (%s)",
+            (AsIs(self._table), AsIs(self._query())),
+        )
+
+    @property
+    def _table_query(self):
+        """Read the materialized rows when that mode is enabled. Otherwise,
+        when the report is read for a range of dates, query only the days of
+        that range instead of the whole history held by the view.
+        """
+        if self._is_materialized():
+            return """
+                SELECT id, employee_id, department_id, date, worked_hours,
+                    theoretical_hours, difference
+                FROM hr_attendance_theoretical_time_report_store
+            """
+        if any(self._get_sql_date_bounds()):
+            return self._query()
+        return None
+
+    def _get_sql_source(self):
+        """Get the SQL source of the rows of the report for being read in raw
+        queries with parameters.
+        """
+        if self._table_query:
+            return "(%s)" % self._table_query
+        return self._table
+
+    def _is_materialized(self):
+        """Whether the report is read from its materialized rows."""
+        return not self.env.context.get("theoretical_report_live") and bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("hr_attendance_report_theoretical_time.materialized")
+        )
+
+    def _get_sql_date_bounds(self):
+        """Get the range of dates the report is being read for as SQL date
+        literals, being None when unbounded.
+        """
+        return tuple(
+            "'%s'::date" % fields.Date.to_date(self.env.context[key])
+            if self.env.context.get(key)
+            else None
+            for key in ("theoretical_date_from", "theoretical_date_to")
+        )
+
+    @api.model
+    def _get_domain_date_range(self, domain):
+        """Get the widest range of dates that the records matching the domain
+        can have.
+
+        :param: domain: Domain on this model.
+        :return: Tuple (date_from, date_to), each one being None if unbounded.
+        """
+
+        def leaf_range(leaf):
+            if not expression.is_leaf(leaf) or leaf[0] != "date" or not leaf[2]:
+                return None, None
+            operator, value = leaf[1], fields.Date.to_date(leaf[2])
+            if operator == "=":
+                return value, value
+            elif operator == ">=":
+                return value, None
+            elif operator == ">":
+                return value + timedelta(days=1), None
+            elif operator == "<=":
+                return None, value
+            elif operator == "<":
+                return None, value - timedelta(days=1)
+            return None, None
+
+        def parse(index):
+            token = normalized[index]
+            if token == "!":
+                index = parse(index + 1)[1]
+                return (None, None), index
+            elif token in ("&", "|"):
+                (from1, to1), index = parse(index + 1)
+                (from2, to2), index = parse(index)
+                if token == "&":
+                    date_from = max(filter(None, (from1, from2)), default=None)
+                    date_to = min(filter(None, (to1, to2)), default=None)
+                else:
+                    date_from = from1 and from2 and min(from1, from2) or None
+                    date_to = to1 and to2 and max(to1, to2) or None
+                return (date_from, date_to), index
+            return leaf_range(token), index + 1
+
+        normalized = expression.normalize_domain(domain)
+        return parse(0)[0]
+
     @api.model
     def _theoretical_hours(self, employee, date):
         """Get theoretical working hours for the day where the check-in is
         done for that employee.
         """
-        if not employee.resource_id.calendar_id:
-            return 0
-        tz = employee.resource_id.calendar_id.tz
-        res = employee.with_context(
-            exclude_public_holidays=True, employee_id=employee.id
-        )._get_work_days_data_batch(
-            datetime.combine(date, time(0, 0, 0, 0, tzinfo=pytz.timezone(tz))),
-            datetime.combine(date, time(23, 59, 59, 99999, tzinfo=pytz.timezone(tz))),
-            # Pass this domain for excluding leaves whose type is included in
-            # theoretical hours
-            domain=[
-                "|",
-                ("holiday_id", "=", False),
-                ("holiday_id.holiday_status_id.include_in_theoretical", "=", False),
-            ],
-        )
-        return res[employee.id]["hours"]
+        date = fields.Date.to_date(date)
+        with instrument(self.env, "report.theoretical_hours"):
+            hours = self._theoretical_hours_batch(employee, date, date)
+        return hours[(employee.id, date)]
 
     @api.model
-    def read_group(
+    def _theoretical_leave_domain(self):
+        """Domain for excluding leaves whose type is included in theoretical
+        hours.
+        """
+        return [
+            "|",
+            ("holiday_id", "=", False),
+            ("holiday_id.holiday_status_id.include_in_theoretical", "=", False),
+        ]
+
+    @api.model
+    def _get_theoretical_cache(self):
+        """Get the cache of theoretical hours passed down by the caller, or a
+        new one.
+        """
+        return self.env.context.get("theoretical_cache") or TheoreticalHoursCache()
+
+    @api.model
+    def _theoretical_hours_batch(self, employees, date_from, date_to, cache=None):
+        """Get theoretical working hours of several employees for each day of
+        a range of dates. Working calendar, leaves and public holidays are
+        evaluated only once per employee for the days of the range not found
+        in the cache, splitting then the resulting work intervals by day.
+
+        :param: employees: Employees recordset.
+        :param: date_from: First date of the range.
+        :param: date_to: Last date of the range.
+        :param: cache: TheoreticalHoursCache to use. The one of the context or
+          a new one if not given.
+        :return: Dictionary {(employee_id, date): hours}.
+        """
+        cache = cache or self._get_theoretical_cache()
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        days = [
+            date_from + timedelta(days=x)
+            for x in range((date_to - date_from).days + 1)
+        ]
+        res = {}
+        for employee in employees:
+            day_hours = cache.day_hours[employee.id]
+            missing = [day for day in days if day not in day_hours]
+            if missing:
+                day_hours.update(
+                    self._compute_day_hours(employee, missing[0], missing[-1], cache)
+                )
+            for day in days:
+                res[(employee.id, day)] = day_hours[day]
+        return res
+
+    @api.model
+    def _compute_day_hours(self, employee, date_from, date_to, cache):
+        """Compute the theoretical hours of each day of a range of dates for
+        an employee.
+
+        :return: Dictionary {date: hours}.
+        """
+        day_hours = {
+            date_from + timedelta(days=x): 0.0
+            for x in range((date_to - date_from).days + 1)
+        }
+        calendar, tz = cache.get_calendar(employee)
+        if not calendar:
+            return day_hours
+        start_dt = tz.localize(datetime.combine(date_from, time.min))
+        end_dt = tz.localize(datetime.combine(date_to + timedelta(days=1), time.min))
+        with instrument(self.env, "report.work_intervals"):
+            intervals = calendar._work_intervals_batch(
+                start_dt,
+                end_dt,
+                resources=employee.resource_id,
+                domain=self._theoretical_leave_domain(),
+            )[employee.resource_id.id]
+        for start, stop, _meta in intervals:
+            start, stop = start.astimezone(tz), stop.astimezone(tz)
+            # Split intervals crossing midnight between both days
+            while start < stop:
+                day = start.date()
+                end = min(
+                    stop,
+                    tz.localize(datetime.combine(day + timedelta(days=1), time.min)),
+                )
+                if day in day_hours:
+                    day_hours[day] += (end - start).total_seconds() / 3600
+                start = end
+        return day_hours
+
+    @api.model
+    def _fill_theoretical_days(self, domain):
+        """Compute and store the theoretical hours of the generated days
+        matching the domain that haven't been computed yet.
+        """
+        self.env["hr.attendance"].flush(
+            ["employee_id", "check_in", "worked_hours", "theoretical_hours"]
+        )
+        # Fetch all the missing days in a single query, without instantiating
+        # the report records
+        query = self._where_calc(
+            expression.AND([domain, [("theoretical_hours", "<", 0)]])
+        )
+        self._apply_ir_rules(query, "read")
+        query_str, params = query.select(
+            '"%s".employee_id' % self._table, '"%s".date' % self._table
+        )
+        with instrument(self.env, "report.fill_days.query"):
+            self.env.cr.execute(query_str, params)
+            rows = self.env.cr.fetchall()
+        dates_by_employee = defaultdict(set)
+        for employee_id, date in rows:
+            dates_by_employee[employee_id].add(date)
+        values = {}
+        cache = self._get_theoretical_cache()
+        employees = self.env["hr.employee"].sudo().browse(list(dates_by_employee))
+        with instrument(self.env, "report.fill_days.compute"):
+            for employee in employees:
+                dates = dates_by_employee[employee.id]
+                hours = self._theoretical_hours_batch(
+                    employee, min(dates), max(dates), cache=cache
+                )
+                for date in dates:
+                    values[(employee.id, date)] = hours[(employee.id, date)]
+            self.env["hr.attendance.theoretical.day"].sudo()._store(values)
+
+    @api.model
+    def _invalidate_theoretical_hours(
+        self, employees=None, date_from=None, date_to=None
+    ):
+        """Hook called when the theoretical hours of the given employees and
+        dates may have changed.
+        """
+        self.env["hr.attendance.theoretical.day"].sudo()._invalidate(
+            employees=employees, date_from=date_from, date_to=date_to
+        )
+        self._refresh_materialized(
+            employees=employees, date_from=date_from, date_to=date_to
+        )
+
+    @api.model
+    def _refresh_materialized(self, employees=None, date_from=None, date_to=None):
+        """Refresh the materialized rows and the totals per period of the given
+        employees and dates, when they are enabled, and drop the checkpoints
+        of the balance that include those dates.
+
+        :param: employees: Employees recordset. All of them if not given.
+        :param: date_from: First date to refresh. Unbounded if not given.
+        :param: date_to: Last date to refresh. Unbounded if not given.
+        """
+        self.env["hr.attendance.theoretical.balance"].sudo()._invalidate(
+            employees=employees, date_from=date_from
+        )
+        if self._is_materialized():
+            self._refresh_store(employees, date_from, date_to)
+        self.env["hr.attendance.theoretical.time.rollup"].sudo()._refresh(
+            employees=employees, date_from=date_from, date_to=date_to
+        )
+
+    @api.model
+    def _refresh_store(self, employees=None, date_from=None, date_to=None):
+        """Refresh the materialized rows of the given employees and dates."""
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        report = self.sudo().with_context(
+            theoretical_report_live=True,
+            theoretical_date_from=fields.Date.to_string(date_from),
+            theoretical_date_to=fields.Date.to_string(date_to),
+        )
+        domain = []
+        where = ["True"]
+        params = []
+        if employees is not None:
+            if not employees:
+                return
+            domain.append(("employee_id", "in", employees.ids))
+            where.append("employee_id IN %s")
+            params.append(tuple(employees.ids))
+        if date_from:
+            domain.append(("date", ">=", date_from))
+            where.append("date >= %s")
+            params.append(date_from)
+        if date_to:
+            domain.append(("date", "<=", date_to))
+            where.append("date <= %s")
+            params.append(date_to)
+        self.env["hr.employee"].flush(["department_id"])
+        report._fill_theoretical_days(domain)
+        where = " AND ".join(where)
+        self.env.cr.execute(
+            "DELETE FROM hr_attendance_theoretical_time_report_store WHERE %s" % where,
+            params,
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO hr_attendance_theoretical_time_report_store
+                (employee_id, department_id, date, worked_hours,
+                 theoretical_hours, difference)
+            SELECT employee_id, department_id, date, worked_hours,
+                theoretical_hours, difference
+            FROM (%s) AS report
+            WHERE %s
+            """
+            % (report._query(), where),
+            params,
+        )
+        self.env["hr.attendance.theoretical.time.report.store"].invalidate_cache()
+
+    @api.model
+    def _refresh_materialized_days(self, dates_by_employee):
+        """Refresh the materialized rows of some days of several employees.
+
+        :param: dates_by_employee: Dictionary {employee: set of dates}.
+        """
+        for employee, dates in dates_by_employee.items():
+            self._refresh_materialized(employee, min(dates), max(dates))
+
+    @api.model
+    def action_refresh_materialized(self):
+        """Rebuild all the materialized rows of the report."""
+        self._refresh_materialized()
+
+    @api.model
+    def _cron_refresh_materialized(self):
+        """Add the rows and update the totals per period of the new days, as
+        the report is generated up to the current date.
+        """
+        self._refresh_materialized(
+            date_from=fields.Date.context_today(self) - timedelta(days=1)
+        )
+
+    @api.model
+    def _export_totals(self, domain, period="month", fetch_size=2000):
+        """Iterate over the totals of each employee and period of the records
+        matching the domain. They are aggregated by the database and fetched
+        by batches through a server-side cursor, for not holding all of them
+        in memory.
+
+        :param: domain: Domain on this model.
+        :param: period: Period to group by: "week", "month" or "year".
+        :param: fetch_size: Number of rows fetched at once.
+        :return: Iterator over tuples (employee name, identification number,
+          period start date, worked hours, theoretical hours, difference).
+        """
+        if period not in ("week", "month", "year"):
+            raise ValueError("Invalid period %s" % period)
+        self.check_access_rights("read")
+        date_from, date_to = self._get_domain_date_range(domain)
+        report = self.with_context(
+            theoretical_date_from=fields.Date.to_string(date_from),
+            theoretical_date_to=fields.Date.to_string(date_to),
+        )
+        report._fill_theoretical_days(domain)
+        query = report._where_calc(domain)
+        report._apply_ir_rules(query, "read")
+        employee_alias = query.left_join(
+            self._table, "employee_id", "hr_employee", "id", "employee_id"
+        )
+        from_clause, where_clause, params = query.get_sql()
+        self.env.cr.execute(
+            """
+            DECLARE theoretical_time_export NO SCROLL CURSOR FOR
+            SELECT "{employee}".name,
+                "{employee}".identification_id,
+                date_trunc(%s, "{report}".date)::date AS period_start,
+                SUM("{report}".worked_hours),
+                SUM("{report}".theoretical_hours),
+                SUM("{report}".difference)
+            FROM {from_clause}
+            WHERE {where_clause}
+            GROUP BY "{report}".employee_id, "{employee}".name,
+                "{employee}".identification_id, period_start
+            ORDER BY "{employee}".name, "{report}".employee_id, period_start
+            """.format(
+                employee=employee_alias,
+                report=self._table,
+                from_clause=from_clause,
+                where_clause=where_clause or "TRUE",
+            ),
+            [period] + params,
+        )
+        try:
+            while True:
+                self.env.cr.execute(
+                    "FETCH FORWARD %s FROM theoretical_time_export", (fetch_size,)
+                )
+                rows = self.env.cr.fetchall()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            self.env.cr.execute("CLOSE theoretical_time_export")
+
+    @api.model
+    def _get_export_headers(self):
+        return [
+            _("Employee"),
+            _("Identification No"),
+            _("Period"),
+            _("Worked"),
+            _("Theoric"),
+            _("Difference"),
+        ]
+
+    @api.model
+    def _export_totals_csv(self, domain, period="month", chunk_size=65536):
+        """Stream the export totals as CSV.
+
+        :return: Iterator over chunks of the encoded file.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self._get_export_headers())
+        rows = self._export_totals(domain, period=period)
+        for name, identification, period_start, worked, theoretical, difference in rows:
+            writer.writerow(
+                [
+                    name,
+                    identification or "",
+                    fields.Date.to_string(period_start),
+                    round(worked, 2),
+                    round(theoretical, 2),
+                    round(difference, 2),
+                ]
+            )
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+    @api.model
+    def _export_totals_xlsx(self, domain, period="month", chunk_size=65536):
+        """Stream the export totals as XLSX. The workbook is written to a
+        temporary file row by row, as the format can't be streamed until it's
+        completely generated.
+
+        :return: Iterator over chunks of the file.
+        """
+        with tempfile.TemporaryFile() as output:
+            workbook = xlsxwriter.Workbook(
+                output, {"constant_memory": True, "in_memory": False}
+            )
+            sheet = workbook.add_worksheet(_("Theoretical Time"))
+            date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+            sheet.write_row(0, 0, self._get_export_headers())
+            rows = self._export_totals(domain, period=period)
+            for row, values in enumerate(rows, start=1):
+                name, identification, period_start, worked, theoretical, diff = values
+                sheet.write_string(row, 0, name or "")
+                sheet.write_string(row, 1, identification or "")
+                sheet.write_datetime(
+                    row, 2, datetime.combine(period_start, time.min), date_format
+                )
+                sheet.write_number(row, 3, worked)
+                sheet.write_number(row, 4, theoretical)
+                sheet.write_number(row, 5, diff)
+            workbook.close()
+            output.seek(0)
+            while True:
+                data = output.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+    @api.model
+    def _is_period_bound(self, leaf, period_type):
+        """Whether the domain leaf on the date is a bound of the periods of
+        the given type, so that it matches either all or none of their days.
+        """
+        operator, value = leaf[1], leaf[2]
+        if operator not in (">=", ">", "<=", "<") or not value:
+            return False
+        value = fields.Date.to_date(value)
+        if operator in (">=", "<"):
+            return date_utils.start_of(value, period_type) == value
+        return date_utils.end_of(value, period_type) == value
+
+    @api.model
+    def _get_rollup_domain(self, domain, period_type):
+        """Translate the domain to the totals per period of the given type, as
+        long as it only filters by employee, department and period bounds.
+
+        :return: Domain on the totals, or None if not translatable.
+        """
+        res = [("period_type", "=", period_type)]
+        for leaf in expression.normalize_domain(domain):
+            if not expression.is_leaf(leaf) or not isinstance(leaf[0], str):
+                res.append(leaf)
+            elif leaf[0].split(".")[0] in ("employee_id", "department_id"):
+                res.append(leaf)
+            elif leaf[0] == "date" and self._is_period_bound(leaf, period_type):
+                res.append(("period_start", leaf[1], leaf[2]))
+            else:
+                return None
+        return res
+
+    @api.model
+    def _translate_rollup_domain(self, domain):
+        """Translate back a domain on the totals per period to this model."""
+        res = []
+        for leaf in domain:
+            if expression.is_leaf(leaf) and leaf[0] == "period_start":
+                res.append(("date", leaf[1], leaf[2]))
+            elif expression.is_leaf(leaf) and leaf[0] == "period_type":
+                res.append(expression.TRUE_LEAF)
+            else:
+                res.append(leaf)
+        return res
+
+    @api.model
+    def _read_group_rollup(
         self, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True
     ):
-        """Compute dynamically theoretical hours amount, computing on the fly
-        theoretical hours for non existing attendances with stored hours.
-        This technique has proven to be more efficient than trying to call
-        recursively `read_group` grouping by date and employee.
-        """
-        res = super(HrAttendanceTheoreticalTimeReport, self).read_group(
-            domain,
-            fields,
-            groupby,
+        """Read the groups from the totals per period when grouping by week,
+        month or year, and the domain, the measures and the order can be
+        expressed on them.
+
+        :return: Result of read_group, or None if the totals can't be used.
+        """
+        rollup = self.env["hr.attendance.theoretical.time.rollup"]
+        if self.env.context.get("theoretical_report_live"):
+            return None
+        if not rollup.sudo()._is_enabled():
+            return None
+        groupby = [groupby] if isinstance(groupby, str) else list(groupby)
+        # Group by specifications on the totals and their equivalent ones
+        groupby_mapping = {}
+        period_type = None
+        for spec in groupby:
+            field_name, __, granularity = spec.partition(":")
+            if field_name in ("employee_id", "department_id") and not granularity:
+                groupby_mapping[spec] = spec
+            elif field_name == "date" and not period_type:
+                period_type = granularity or "month"
+                groupby_mapping["period_start:%s" % period_type] = spec
+            else:
+                return None
+        if period_type not in PERIOD_TYPES:
+            return None
+        measures = {"worked_hours", "theoretical_hours", "difference"}
+        rollup_fields = ["day_count"]
+        for spec in fields:
+            field_name, __, aggregator = spec.partition(":")
+            if field_name in measures:
+                # Only sums of the totals give the same result as on the days
+                if aggregator not in ("", "sum"):
+                    return None
+                rollup_fields.append(spec)
+            elif field_name not in ("__count", "employee_id", "department_id", "date"):
+                return None
+        rollup_domain = self._get_rollup_domain(domain, period_type)
+        if rollup_domain is None:
+            return None
+        rollup_orderby = []
+        for term in (orderby or "").split(","):
+            if not term.strip():
+                continue
+            field_name, *direction = term.split()
+            if field_name == "date":
+                field_name = "period_start"
+            elif field_name not in measures | {"employee_id", "department_id"}:
+                return None
+            rollup_orderby.append(" ".join([field_name] + direction))
+        result = rollup.read_group(
+            rollup_domain,
+            rollup_fields,
+            list(groupby_mapping),
             offset=offset,
             limit=limit,
-            orderby=orderby,
+            orderby=", ".join(rollup_orderby),
             lazy=lazy,
         )
-
-        if "theoretical_hours:sum" not in fields:
-            return res
-
-        full_fields = all(
-            x in fields
-            for x in {"theoretical_hours:sum", "worked_hours:sum", "difference:sum"}
-        )
-        difference_field = "difference:sum" in fields
-        for line in res:
-            day_dict = {}
-            records = self.search(line.get("__domain", domain))
-            for record in records:
-                key = (record.employee_id.id, record.date)
-                if key not in day_dict:
-                    if record.theoretical_hours < 0:
-                        day_dict[key] = self._theoretical_hours(
-                            record.employee_id.sudo(), record.date
-                        )
-                    else:
-                        day_dict[key] = record.theoretical_hours
-            line["theoretical_hours"] = sum(day_dict.values())
-            if full_fields:  # compute difference
-                line["difference"] = (line["worked_hours"] or 0.0) - line[
-                    "theoretical_hours"
+        if lazy:
+            rollup_count_key = "%s_count" % list(groupby_mapping)[0].split(":")[0]
+            count_key = "%s_count" % groupby[0].split(":")[0]
+        else:
+            rollup_count_key = count_key = "__count"
+        for group in result:
+            # Count the report rows instead of the totals
+            group.pop(rollup_count_key, None)
+            group[count_key] = group.pop("day_count") or 0
+            for rollup_spec, spec in groupby_mapping.items():
+                if rollup_spec in group:
+                    group[spec] = group.pop(rollup_spec)
+                if rollup_spec in group.get("__range", {}):
+                    group["__range"][spec] = group["__range"].pop(rollup_spec)
+            if "__domain" in group:
+                group["__domain"] = self._translate_rollup_domain(group["__domain"])
+            if group.get("__context", {}).get("group_by"):
+                group["__context"]["group_by"] = [
+                    groupby_mapping.get(spec, spec)
+                    for spec in group["__context"]["group_by"]
                 ]
-            elif difference_field:  # Remove wrong 0 values
-                del line["difference"]
-        return res
+        return result
+
+    @api.model
+    def read_group(
+        self, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True
+    ):
+        """Read the totals per period when they are enabled and can be used.
+        Otherwise, compute and store first the theoretical hours of the days
+        without attendances that are still missing, so that the aggregation
+        of all the measures is done directly by the database. The report is
+        only generated for the range of dates the domain is restricted to.
+        """
+        with instrument(self.env, "report.read_group"):
+            res = self._read_group_rollup(
+                domain,
+                fields,
+                groupby,
+                offset=offset,
+                limit=limit,
+                orderby=orderby,
+                lazy=lazy,
+            )
+            if res is not None:
+                return res
+            date_from, date_to = self._get_domain_date_range(domain)
+            # The fields argument shadows the module of the same name
+            self = self.with_context(
+                theoretical_date_from=date_from and str(date_from),
+                theoretical_date_to=date_to and str(date_to),
+            )
+            self._fill_theoretical_days(domain)
+            with instrument(self.env, "report.read_group.query"):
+                return super().read_group(
+                    domain,
+                    fields,
+                    groupby,
+                    offset=offset,
+                    limit=limit,
+                    orderby=orderby,
+                    lazy=lazy,
+                )
@@ -0,0 +1,36 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models, tools
+
+
+class HrAttendanceTheoreticalTimeReportStore(models.Model):
+    """Materialized rows of the theoretical time report, used instead of the
+    view when the materialized mode is enabled.
+    """
+
+    _name = "hr.attendance.theoretical.time.report.store"
+    _description = "Materialized report of theoretical time vs attendance time"
+    _order = "date,employee_id"
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee", string="Employee", ondelete="cascade"
+    )
+    department_id = fields.Many2one(comodel_name="hr.department", string="Department")
+    date = fields.Date()
+    worked_hours = fields.Float(string="Worked")
+    theoretical_hours = fields.Float(string="Theoric")
+    difference = fields.Float()
+
+    def init(self):
+        tools.create_index(
+            self.env.cr,
+            "hr_attendance_theoretical_time_report_store_employee_date_index",
+            self._table,
+            ["employee_id", "date"],
+        )
+        tools.create_index(
+            self.env.cr,
+            "hr_attendance_theoretical_time_report_store_department_date_index",
+            self._table,
+            ["department_id", "date"],
+        )
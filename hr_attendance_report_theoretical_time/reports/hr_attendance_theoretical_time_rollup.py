@@ -0,0 +1,165 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, tools
+from odoo.tools import date_utils
+
+PERIOD_TYPES = ("week", "month", "year")
+
+
+class HrAttendanceTheoreticalTimeRollup(models.Model):
+    """Totals of the theoretical time report per employee and week, month or
+    year, read by the report instead of its rows when grouping by any of
+    those periods.
+    """
+
+    _name = "hr.attendance.theoretical.time.rollup"
+    _description = "Totals of theoretical time vs attendance time per period"
+    _order = "period_start,employee_id"
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee",
+        string="Employee",
+        required=True,
+        ondelete="cascade",
+    )
+    department_id = fields.Many2one(comodel_name="hr.department", string="Department")
+    period_type = fields.Selection(
+        selection=[("week", "Week"), ("month", "Month"), ("year", "Year")],
+        required=True,
+    )
+    period_start = fields.Date(required=True)
+    day_count = fields.Integer(help="Number of report rows of the period")
+    worked_hours = fields.Float(string="Worked")
+    theoretical_hours = fields.Float(string="Theoric")
+    difference = fields.Float()
+
+    _sql_constraints = [
+        (
+            "employee_period_unique",
+            "UNIQUE(employee_id, period_type, period_start)",
+            "Totals can only be stored once per employee and period.",
+        )
+    ]
+
+    def init(self):
+        tools.create_index(
+            self.env.cr,
+            "hr_attendance_theoretical_time_rollup_period_index",
+            self._table,
+            ["period_type", "period_start"],
+        )
+
+    @api.model
+    def _is_enabled(self):
+        """Whether the totals have been built, and are then kept up to date
+        and read by the report.
+        """
+        return bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("hr_attendance_report_theoretical_time.rollups")
+        )
+
+    @api.model
+    def _rebuild(self):
+        """Build all the totals from scratch, enabling their use once done."""
+        config = self.env["ir.config_parameter"].sudo()
+        config.set_param("hr_attendance_report_theoretical_time.rollups", False)
+        self._refresh_totals()
+        config.set_param("hr_attendance_report_theoretical_time.rollups", "True")
+
+    @api.model
+    def _clear(self):
+        """Drop all the totals, disabling their use."""
+        self.env["ir.config_parameter"].sudo().set_param(
+            "hr_attendance_report_theoretical_time.rollups", False
+        )
+        self.flush()
+        self.env.cr.execute("DELETE FROM hr_attendance_theoretical_time_rollup")
+        self.invalidate_cache()
+
+    @api.model
+    def _refresh(self, employees=None, date_from=None, date_to=None):
+        """Refresh the totals of the given employees and dates when they are
+        enabled.
+        """
+        if self._is_enabled():
+            self._refresh_totals(
+                employees=employees, date_from=date_from, date_to=date_to
+            )
+
+    @api.model
+    def _refresh_totals(self, employees=None, date_from=None, date_to=None):
+        """Compute again the totals of the periods that include the given
+        dates, from the materialized report rows when that mode is enabled or
+        from the generated ones otherwise.
+
+        :param: employees: Employees recordset. All of them if not given.
+        :param: date_from: First date to refresh. Unbounded if not given.
+        :param: date_to: Last date to refresh. Unbounded if not given.
+        """
+        if employees is not None and not employees:
+            return
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        bounds = {
+            period_type: (
+                date_from and date_utils.start_of(date_from, period_type),
+                date_to and date_utils.end_of(date_to, period_type),
+            )
+            for period_type in PERIOD_TYPES
+        }
+        # Weeks can start or end in other years
+        report_from = date_from and min(x[0] for x in bounds.values())
+        report_to = date_to and max(x[1] for x in bounds.values())
+        report = (
+            self.env["hr.attendance.theoretical.time.report"]
+            .sudo()
+            .with_context(
+                theoretical_date_from=fields.Date.to_string(report_from),
+                theoretical_date_to=fields.Date.to_string(report_to),
+            )
+        )
+        employee_domain = []
+        if employees is not None:
+            employee_domain = [("employee_id", "in", employees.ids)]
+        if not report._is_materialized():
+            report._fill_theoretical_days(employee_domain)
+        self.flush()
+        for period_type, (period_from, period_to) in bounds.items():
+            rollup_where = ["period_type = %s"]
+            report_where = ["True"]
+            params = []
+            if employees is not None:
+                rollup_where.append("employee_id IN %s")
+                report_where.append("employee_id IN %s")
+                params.append(tuple(employees.ids))
+            if period_from:
+                rollup_where.append("period_start >= %s")
+                report_where.append("date >= %s")
+                params.append(period_from)
+            if period_to:
+                rollup_where.append("period_start <= %s")
+                report_where.append("date <= %s")
+                params.append(period_to)
+            self.env.cr.execute(
+                "DELETE FROM hr_attendance_theoretical_time_rollup WHERE %s"
+                % " AND ".join(rollup_where),
+                [period_type] + params,
+            )
+            self.env.cr.execute(
+                """
+                INSERT INTO hr_attendance_theoretical_time_rollup
+                    (employee_id, department_id, period_type, period_start,
+                     day_count, worked_hours, theoretical_hours, difference)
+                SELECT employee_id, department_id, %%s,
+                    date_trunc(%%s, date)::date AS period_start, count(*),
+                    sum(worked_hours), sum(theoretical_hours), sum(difference)
+                FROM %s AS report
+                WHERE %s
+                GROUP BY employee_id, department_id, period_start
+                """
+                % (report._get_sql_source(), " AND ".join(report_where)),
+                [period_type, period_type] + params,
+            )
+        self.invalidate_cache()
@@ -0,0 +1,314 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import logging
+import os
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+
+from psycopg2.extras import execute_values
+
+from odoo import fields
+from odoo.tests import common, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+def _get_env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+@tagged("-standard", "-at_install", "post_install", "theoretical_benchmark")
+class TestBenchmarkTheoreticalTime(common.TransactionCase):
+    """Benchmark of the theoretical time computation and report over synthetic
+    data. It's not run by default, but with ``--test-tags theoretical_benchmark``.
+
+    The size of the generated data is given by these environment variables:
+
+    * ``THEORETICAL_BENCHMARK_EMPLOYEES``: Number of employees (20).
+    * ``THEORETICAL_BENCHMARK_CALENDARS``: Number of working calendars (3).
+    * ``THEORETICAL_BENCHMARK_DEPARTMENTS``: Number of departments (4).
+    * ``THEORETICAL_BENCHMARK_YEARS``: Years of attendances until yesterday (2).
+    * ``THEORETICAL_BENCHMARK_TRACEMALLOC``: Set to 0 for not measuring the
+      peak memory, as it slows down the execution (1).
+
+    Wall time, SQL queries and peak Python memory of each measured operation
+    are logged, and kept in the ``results`` dictionary of the class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(
+            context=dict(
+                cls.env.context,
+                mail_create_nolog=True,
+                mail_create_nosubscribe=True,
+                mail_notrack=True,
+                no_reset_password=True,
+                tracking_disable=True,
+            )
+        )
+        cls.employee_count = _get_env_int("THEORETICAL_BENCHMARK_EMPLOYEES", 20)
+        cls.calendar_count = _get_env_int("THEORETICAL_BENCHMARK_CALENDARS", 3)
+        cls.department_count = _get_env_int("THEORETICAL_BENCHMARK_DEPARTMENTS", 4)
+        cls.years = _get_env_int("THEORETICAL_BENCHMARK_YEARS", 2)
+        cls.trace_memory = bool(_get_env_int("THEORETICAL_BENCHMARK_TRACEMALLOC", 1))
+        cls.date_to = fields.Date.today() - timedelta(days=1)
+        cls.date_from = date(cls.date_to.year - cls.years + 1, 1, 1)
+        cls.results = {}
+        cls._generate_data()
+
+    @classmethod
+    def _generate_calendars(cls):
+        calendars = cls.env["resource.calendar"]
+        for i in range(cls.calendar_count):
+            # Full and reduced schedules, in several timezones
+            afternoon_to = 17 - i % 3
+            calendars |= calendars.create(
+                {
+                    "name": "Benchmark Calendar %s" % i,
+                    "tz": ("UTC", "Europe/Madrid", "America/New_York")[i % 3],
+                    "attendance_ids": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": "Attendance",
+                                "dayofweek": str(day),
+                                "hour_from": hour_from,
+                                "hour_to": hour_to,
+                            },
+                        )
+                        for day in range(5)
+                        for hour_from, hour_to in ((8, 12), (13, afternoon_to))
+                    ],
+                }
+            )
+        return calendars
+
+    @classmethod
+    def _generate_public_holidays(cls):
+        HrHolidaysPublic = cls.env["hr.holidays.public"]
+        for year in range(cls.date_from.year, cls.date_to.year + 1):
+            holidays = HrHolidaysPublic.search(
+                [("year", "=", year), ("country_id", "=", False)]
+            )
+            if not holidays:
+                holidays = HrHolidaysPublic.create({"year": year})
+            existing_dates = set(holidays.line_ids.mapped("date"))
+            holidays.line_ids = [
+                (0, 0, {"name": "Benchmark Holiday", "date": holiday_date})
+                for holiday_date in (
+                    date(year, 1, 1),
+                    date(year, 5, 1),
+                    date(year, 8, 15),
+                    date(year, 12, 25),
+                )
+                if holiday_date not in existing_dates
+            ]
+
+    @classmethod
+    def _generate_leaves(cls, employees):
+        """Two leaves of two days per employee and year, one of a leave type
+        included in the theoretical time and another one not included.
+        """
+        leave_types = cls.env["hr.leave.type"].create(
+            [
+                {
+                    "name": "Benchmark Leave Type %s" % include,
+                    "requires_allocation": "no",
+                    "include_in_theoretical": include,
+                }
+                for include in (False, True)
+            ]
+        )
+        vals_list = []
+        for year in range(cls.date_from.year, cls.date_to.year + 1):
+            for leave_type, month in zip(leave_types, (3, 10)):
+                first_day = date(year, month, 1)
+                # Monday and Tuesday of the second week of the month
+                leave_from = first_day + timedelta(days=7 - first_day.weekday())
+                leave_to = leave_from + timedelta(days=1)
+                if leave_to > cls.date_to:
+                    continue
+                vals_list += [
+                    {
+                        "date_from": datetime.combine(leave_from, time.min),
+                        "date_to": datetime.combine(leave_to, time(23, 59, 59)),
+                        "request_date_from": leave_from,
+                        "request_date_to": leave_to,
+                        "employee_id": employee.id,
+                        "holiday_status_id": leave_type.id,
+                    }
+                    for employee in employees
+                ]
+        leaves = cls.env["hr.leave"].create(vals_list)
+        leaves._compute_date_from_to()
+        leaves.action_validate()
+
+    @classmethod
+    def _generate_attendances(cls, employees):
+        """Attendances of two periods per working day, inserted directly in
+        the database for not spending the generation time on the constraints
+        of the attendances.
+        """
+        rows = []
+        now = fields.Datetime.now()
+        current_date = cls.date_from
+        while current_date <= cls.date_to:
+            day_start = datetime.combine(current_date, time.min)
+            if current_date.weekday() < 5:
+                for employee in employees:
+                    for hour_from, hour_to in ((8, 12), (13, 17)):
+                        rows.append(
+                            (
+                                employee.id,
+                                day_start + timedelta(hours=hour_from),
+                                day_start + timedelta(hours=hour_to),
+                                hour_to - hour_from,
+                                cls.env.uid,
+                                now,
+                                cls.env.uid,
+                                now,
+                            )
+                        )
+            current_date += timedelta(days=1)
+        execute_values(
+            cls.env.cr,
+            """
+            INSERT INTO hr_attendance
+                (employee_id, check_in, check_out, worked_hours, create_uid,
+                 create_date, write_uid, write_date)
+            VALUES %s
+            """,
+            rows,
+            page_size=10000,
+        )
+        cls.env["hr.attendance"].invalidate_cache()
+
+    @classmethod
+    def _generate_data(cls):
+        calendars = cls._generate_calendars()
+        departments = cls.env["hr.department"].create(
+            [
+                {"name": "Benchmark Department %s" % i}
+                for i in range(cls.department_count)
+            ]
+        )
+        cls.employees = cls.env["hr.employee"].create(
+            [
+                {
+                    "name": "Benchmark Employee %s" % i,
+                    "resource_calendar_id": calendars[i % len(calendars)].id,
+                    "department_id": departments[i % len(departments)].id,
+                }
+                for i in range(cls.employee_count)
+            ]
+        )
+        # Generate the report days since the beginning of the data
+        cls.env.cr.execute(
+            "UPDATE hr_employee SET create_date = %s WHERE id IN %s",
+            (cls.date_from, tuple(cls.employees.ids)),
+        )
+        cls.employees.invalidate_cache(["create_date"])
+        cls._generate_public_holidays()
+        cls._generate_leaves(cls.employees)
+        cls._generate_attendances(cls.employees)
+        cls.attendances = cls.env["hr.attendance"].search(
+            [("employee_id", "in", cls.employees.ids)]
+        )
+        cls.attendances._recompute_theoretical_hours()
+        cls.attendances.flush()
+        _logger.info(
+            "Theoretical time benchmark data: %s employees, %s calendars, "
+            "%s departments, %s attendances from %s to %s",
+            cls.employee_count,
+            cls.calendar_count,
+            cls.department_count,
+            len(cls.attendances),
+            cls.date_from,
+            cls.date_to,
+        )
+
+    @contextmanager
+    def _measure(self, name):
+        """Measure the wall time, SQL queries and peak memory of the block,
+        starting with empty caches.
+        """
+        self.env["base"].flush()
+        self.env["base"].invalidate_cache()
+        self.env["hr.attendance.theoretical.time.report"].clear_caches()
+        queries = self.env.cr.sql_log_count
+        if self.trace_memory:
+            tracemalloc.start()
+        start = perf_counter()
+        peak = 0
+        try:
+            yield
+            self.env["base"].flush()
+        finally:
+            elapsed = perf_counter() - start
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        queries = self.env.cr.sql_log_count - queries
+        self.results[name] = {"time": elapsed, "queries": queries, "memory": peak}
+        _logger.info(
+            "Theoretical time benchmark %s: %.3f s, %s queries, %.1f MiB",
+            name,
+            elapsed,
+            queries,
+            peak / 1024 / 1024,
+        )
+
+    def _read_report(self, groupby):
+        return self.env["hr.attendance.theoretical.time.report"].read_group(
+            [
+                ("employee_id", "in", self.employees.ids),
+                ("date", ">=", self.date_from),
+                ("date", "<=", self.date_to),
+            ],
+            ["worked_hours", "theoretical_hours", "difference"],
+            groupby,
+            lazy=False,
+        )
+
+    def test_read_group_employee_month(self):
+        with self._measure("read_group employee x month (cold)"):
+            res = self._read_report(["employee_id", "date:month"])
+        with self._measure("read_group employee x month (warm)"):
+            self.assertEqual(self._read_report(["employee_id", "date:month"]), res)
+        self.assertTrue(res)
+
+    def test_read_group_department_week(self):
+        with self._measure("read_group department x week (cold)"):
+            res = self._read_report(["department_id", "date:week"])
+        with self._measure("read_group department x week (warm)"):
+            self.assertEqual(self._read_report(["department_id", "date:week"]), res)
+        self.assertTrue(res)
+
+    def test_recompute_wizard(self):
+        wizard = self.env["recompute.theoretical.attendance"].create(
+            {
+                "employee_ids": [(6, 0, self.employees.ids)],
+                "date_from": datetime.combine(self.date_from, time.min),
+                "date_to": datetime.combine(self.date_to, time(23, 59, 59)),
+            }
+        )
+        with self._measure("recompute wizard"):
+            wizard.action_recompute()
+            self.env["recompute.theoretical.attendance.job"]._cron_process(
+                time_limit=24 * 3600
+            )
+        self.assertFalse(
+            self.env["recompute.theoretical.attendance.job"].search(
+                [("state", "=", "pending")]
+            )
+        )
+
+    def test_compute_theoretical_hours(self):
+        with self._measure("_compute_theoretical_hours"):
+            self.attendances._recompute_theoretical_hours()
+        self.assertTrue(any(self.attendances.mapped("theoretical_hours")))
@@ -8,6 +8,8 @@ from odoo.tests import common
 
 from odoo.addons.resource.tests.common import TestResourceCommon
 
+from ..reports.hr_attendance_theoretical_time_report import TheoreticalHoursCache
+
 
 class TestHrAttendanceReportTheoreticalTimeBase(common.TransactionCase):
     @classmethod
@@ -179,6 +181,159 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
         self.assertEqual(self.attendances[14].theoretical_hours, 8)
         self.assertEqual(self.attendances[15].theoretical_hours, 8)
 
+    def test_theoretical_hours_recompute_job(self):
+        self.calendar.attendance_ids.filtered(lambda x: x.hour_from == 14.0).unlink()
+        open_attendance = self.env["hr.attendance"].create(
+            {"employee_id": self.employee_1.id, "check_in": "1947-01-02 08:00:00"}
+        )
+        job = self.env["recompute.theoretical.attendance.job"]._enqueue(
+            self.employee_1 | self.employee_2,
+            "1946-12-23 00:00:00",
+            "1947-01-02 23:59:59",
+        )
+        # One chunk per employee and month
+        job._process_chunk()
+        self.assertEqual(job.cursor_date, datetime.datetime(1947, 1, 1))
+        self.assertEqual(self.attendances[0].theoretical_hours, 4)
+        self.assertEqual(open_attendance.theoretical_hours, 8)
+        job._process_chunk()
+        self.assertEqual(job.pending_employee_ids, self.employee_2)
+        self.assertEqual(job.progress, 50)
+        self.assertEqual(self.attendances[14].theoretical_hours, 8)
+        self.assertEqual(job.state, "pending")
+        job._process()
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.progress, 100)
+        # Open attendances are included
+        self.assertEqual(open_attendance.theoretical_hours, 4)
+        self.assertEqual(self.attendances[14].theoretical_hours, 4)
+
+    def test_recompute_partitions(self):
+        Job = self.env["recompute.theoretical.attendance.job"]
+        employees = self.employee_1 | self.employee_2
+        partitions = Job._get_partitions(chunk_size=1, company_ids=self.env.company.ids)
+        self.assertIn((self.env.company.id, self.employee_1.ids), partitions)
+        self.assertIn((self.env.company.id, self.employee_2.ids), partitions)
+        self.assertTrue(all(len(x[1]) == 1 for x in partitions))
+        self.calendar.attendance_ids.filtered(lambda x: x.hour_from == 14.0).unlink()
+        count = Job._recompute_partition(employees.ids, "1946-12-23", "1946-12-24")
+        self.assertEqual(count, 8)
+        self.assertEqual(self.attendances[0].theoretical_hours, 4)
+        self.assertEqual(self.attendances[3].theoretical_hours, 4)
+        # Out of the dates
+        self.assertEqual(self.attendances[14].theoretical_hours, 8)
+
+    def test_employee_calendar_change_recompute(self):
+        calendar = self.env["resource.calendar"].create(
+            {
+                "name": "Mornings",
+                "attendance_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": "Morning",
+                            "dayofweek": str(day),
+                            "hour_from": 8,
+                            "hour_to": 12,
+                        },
+                    )
+                    for day in range(5)
+                ],
+            }
+        )
+        Job = self.env["recompute.theoretical.attendance.job"]
+        jobs = Job.search([])
+        self.employee_1.resource_calendar_id = calendar
+        job = Job.search([]) - jobs
+        self.assertEqual(job.employee_ids, self.employee_1)
+        self.assertEqual(job.date_from, datetime.datetime(1946, 12, 23))
+        self.assertFalse(job.weekdays)
+        # Writing the same calendar doesn't recompute anything
+        self.employee_1.resource_calendar_id = calendar
+        self.assertEqual(Job.search([]) - jobs, job)
+        # First month
+        job._process_chunk()
+        self.assertEqual(self.attendances[0].theoretical_hours, 4)
+        res = self.env["hr.attendance.theoretical.time.report"].read_group(
+            [("employee_id", "=", self.employee_1.id), ("date", "=", "1946-12-23")],
+            ["theoretical_hours:sum"],
+            ["employee_id"],
+        )
+        self.assertEqual(res[0]["theoretical_hours"], 4)
+
+    def test_calendar_change_recompute(self):
+        # 1946-12-28 - Saturday
+        attendance = self.env["hr.attendance"].create(
+            {
+                "employee_id": self.employee_1.id,
+                "check_in": "1946-12-28 08:00:00",
+                "check_out": "1946-12-28 12:00:00",
+            }
+        )
+        self.assertEqual(attendance.theoretical_hours, 0)
+        self.calendar.attendance_ids = [
+            (
+                0,
+                0,
+                {
+                    "name": "Saturday",
+                    "dayofweek": "5",
+                    "hour_from": "08",
+                    "hour_to": "12",
+                    "date_from": "1946-12-01",
+                    "date_to": "1946-12-31",
+                },
+            )
+        ]
+        job = self.env["recompute.theoretical.attendance.job"].search([], limit=1)
+        self.assertEqual(job.employee_ids, self.employee_1 | self.employee_2)
+        # Starting on the first attendance of the employees
+        self.assertEqual(job.date_from, datetime.datetime(1946, 12, 23))
+        self.assertEqual(job.date_to, datetime.datetime(1946, 12, 31, 23, 59, 59))
+        self.assertEqual(job.weekdays, "5")
+        self.assertFalse(job.week_types)
+        self.assertEqual(attendance.theoretical_hours, 0)
+        job._process()
+        self.assertEqual(attendance.theoretical_hours, 4)
+        self.assertEqual(self.attendances[0].theoretical_hours, 8)
+
+    def test_theoretical_hours_batch(self):
+        obj = self.env["hr.attendance.theoretical.time.report"]
+        res = obj._theoretical_hours_batch(
+            self.employee_1 | self.employee_2, "1946-12-23", "1946-12-29"
+        )
+        self.assertEqual(len(res), 14)
+        days = [datetime.date(1946, 12, day) for day in range(23, 30)]
+        self.assertEqual(
+            [res[(self.employee_1.id, day)] for day in days], [8, 8, 0, 0, 8, 0, 0]
+        )
+        self.assertEqual(
+            [res[(self.employee_2.id, day)] for day in days], [0, 0, 0, 8, 8, 0, 0]
+        )
+
+    def test_theoretical_hours_batch_cache(self):
+        obj = self.env["hr.attendance.theoretical.time.report"]
+        cache = TheoreticalHoursCache()
+        obj._theoretical_hours_batch(
+            self.employee_1, "1946-12-23", "1946-12-25", cache=cache
+        )
+        # Only the days not computed yet are evaluated
+        self.assertEqual(
+            sorted(cache.day_hours[self.employee_1.id]),
+            [datetime.date(1946, 12, day) for day in range(23, 26)],
+        )
+        res = obj.with_context(theoretical_cache=cache)._theoretical_hours_batch(
+            self.employee_1, "1946-12-24", "1946-12-27"
+        )
+        self.assertEqual(len(cache.day_hours[self.employee_1.id]), 5)
+        self.assertEqual(list(res.values()), [8, 0, 0, 8])
+        with self.assertQueryCount(0):
+            res = obj._theoretical_hours_batch(
+                self.employee_1, "1946-12-23", "1946-12-27", cache=cache
+            )
+        self.assertEqual(list(res.values()), [8, 8, 0, 0, 8])
+
     def test_theoretical_hours_recompute(self):
         """Change calendar, and then recompute with the wizard"""
         # Get rid of 4 hours per day so the theoretical should be 4.
@@ -197,6 +352,10 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
             }
         )
         wizard.action_recompute()
+        # Recomputation is done in background
+        self.assertEqual(self.attendances[0].theoretical_hours, 8)
+        # The last job is the wizard one, not the one of the calendar change
+        self.env["recompute.theoretical.attendance.job"].search([], limit=1)._process()
         # Attendances for day 23 are recomputed
         self.assertEqual(self.attendances[0].theoretical_hours, 4)
         self.assertEqual(self.attendances[1].theoretical_hours, 4)
@@ -246,6 +405,293 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
         self.assertEqual(res[4]["theoretical_hours"], 8)  # 1946-12-27(virtual)
         self.assertEqual(res[5]["theoretical_hours"], 8)  # 1946-12-30(virtual)
 
+    def test_report_domain_date_range(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        self.assertEqual(report._get_domain_date_range([]), (None, None))
+        self.assertEqual(
+            report._get_domain_date_range(
+                [
+                    ("date", ">=", "1946-12-23"),
+                    ("date", "<", "1946-12-31"),
+                    ("employee_id", "=", self.employee_1.id),
+                ]
+            ),
+            (datetime.date(1946, 12, 23), datetime.date(1946, 12, 30)),
+        )
+        # Union of both months
+        self.assertEqual(
+            report._get_domain_date_range(
+                [
+                    "|",
+                    "&",
+                    ("date", ">=", "1946-11-01"),
+                    ("date", "<", "1946-12-01"),
+                    ("date", ">=", "1946-12-01"),
+                ]
+            ),
+            (datetime.date(1946, 11, 1), None),
+        )
+        self.assertEqual(
+            report._get_domain_date_range(
+                ["|", ("date", "=", "1946-12-23"), ("employee_id", "=", 1)]
+            ),
+            (None, None),
+        )
+        self.assertEqual(
+            report._get_domain_date_range(["!", ("date", ">", "1946-12-23")]),
+            (None, None),
+        )
+
+    def test_report_ids(self):
+        records = self.env["hr.attendance.theoretical.time.report"].search(
+            [
+                ("employee_id", "=", self.employee_1.id),
+                ("date", "in", ["1946-12-23", "1946-12-27"]),
+            ]
+        )
+        self.assertEqual(len(records), 2)
+        # Day with attendances
+        self.assertEqual(records[0].id, self.attendances[0].id << 1)
+        # Generated day
+        ordinal = datetime.date(1946, 12, 27).toordinal() - 1
+        self.assertEqual(
+            records[1].id, (((self.employee_1.id << 21) | ordinal) << 1) | 1
+        )
+
+    def _assert_no_attendance_seq_scan(self, query, params=None):
+        # Discourage sequential scans, as done by the planner on big tables
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        try:
+            self.env.cr.execute("EXPLAIN %s" % query, params)
+            plan = "\n".join(row[0] for row in self.env.cr.fetchall())
+        finally:
+            self.env.cr.execute("SET LOCAL enable_seqscan = on")
+        self.assertNotRegex(plan, r"Seq Scan on hr_attendance\b")
+
+    def test_query_plans(self):
+        self.env["hr.attendance"].flush()
+        report = self.env["hr.attendance.theoretical.time.report"].with_context(
+            theoretical_date_from="1946-12-01",
+            theoretical_date_to="1946-12-31",
+            theoretical_report_live=True,
+        )
+        self._assert_no_attendance_seq_scan(report._query())
+        # Recomputation of the attendances of an employee
+        domain = [
+            ("employee_id", "=", self.employee_1.id),
+            ("check_in", ">=", "1946-12-01 00:00:00"),
+            ("check_in", "<", "1947-01-01 00:00:00"),
+        ]
+        query = self.env["hr.attendance"]._where_calc(domain)
+        self._assert_no_attendance_seq_scan(*query.select())
+
+    def test_theoretical_day_storage(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        theoretical_day = self.env["hr.attendance.theoretical.day"]
+        domain = [
+            ("date", ">=", "1946-12-23"),
+            ("date", "<", "1946-12-31"),
+            ("employee_id", "=", self.employee_1.id),
+        ]
+        report.read_group(domain, ["theoretical_hours:sum"], ["employee_id"])
+        # Only the days without attendances are stored
+        days = theoretical_day.search([("employee_id", "=", self.employee_1.id)])
+        self.assertEqual(
+            days.mapped("date"),
+            [datetime.date(1946, 12, 27), datetime.date(1946, 12, 30)],
+        )
+        self.assertEqual(days.mapped("hours"), [8, 8])
+        # Changing a public holiday drops the stored hours of that date
+        self.public_holiday_global.line_ids[0].write({"date": "1946-12-27"})
+        self.assertEqual(days.exists().mapped("date"), [datetime.date(1946, 12, 30)])
+        res = report.read_group(domain, ["theoretical_hours:sum"], ["date:day"])
+        self.assertEqual(res[4]["theoretical_hours"], 0)  # 1946-12-27
+        day = theoretical_day.search(
+            [("employee_id", "=", self.employee_1.id), ("date", "=", "1946-12-27")]
+        )
+        self.assertEqual(day.hours, 0)
+        # Attendance users only read the days of their own employee
+        user = common.new_test_user(
+            self.env,
+            login="theoretical_day",
+            groups="hr_attendance.group_hr_attendance",
+        )
+        self.assertFalse(theoretical_day.with_user(user).search([]))
+        self.employee_1.user_id = user
+        self.assertEqual(
+            theoretical_day.with_user(user).search([]),
+            theoretical_day.search([("employee_id", "=", self.employee_1.id)]),
+        )
+
+    def test_materialized_report(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        self.env["ir.config_parameter"].sudo().set_param(
+            "hr_attendance_report_theoretical_time.materialized", "True"
+        )
+        report._refresh_materialized(date_from="1946-12-23", date_to="1946-12-31")
+        domain = [
+            ("date", ">=", "1946-12-23"),
+            ("date", "<", "1946-12-31"),
+            ("employee_id", "=", self.employee_1.id),
+        ]
+        fields = ["theoretical_hours:sum", "worked_hours:sum", "difference:sum"]
+        res = report.read_group(domain, fields, ["employee_id"])
+        self.assertEqual(res[0]["theoretical_hours"], 32)
+        self.assertEqual(res[0]["worked_hours"], 32)
+        self.assertEqual(res[0]["difference"], 0)
+        # Attendance changes are reflected in the materialized rows
+        self.attendances[1].check_out = "1946-12-23 19:00:00"
+        res = report.read_group(domain, fields, ["employee_id"])
+        self.assertEqual(res[0]["worked_hours"], 33)
+        self.assertEqual(res[0]["difference"], 1)
+        # Also leave changes
+        self.leave.action_refuse()
+        res = report.read_group(domain, fields, ["employee_id"])
+        self.assertEqual(res[0]["theoretical_hours"], 40)
+
+    def test_materialized_report_full_refresh(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        employees = self.employee_1 | self.employee_2
+        start_date = datetime.date.today() - datetime.timedelta(days=14)
+        employees.write({"theoretical_hours_start_date": start_date})
+        self.env["ir.config_parameter"].sudo().set_param(
+            "hr_attendance_report_theoretical_time.materialized", "True"
+        )
+        report.action_refresh_materialized()
+        domain = [("employee_id", "in", employees.ids)]
+        stored = report.search(domain)
+        self.assertTrue(stored.filtered(lambda x: x.date >= start_date))
+        live = report.with_context(theoretical_report_live=True)
+        fields = ["theoretical_hours:sum", "worked_hours:sum"]
+        self.assertEqual(
+            report.read_group(domain, fields, ["employee_id"]),
+            live.read_group(domain, fields, ["employee_id"]),
+        )
+
+    def _assert_rollup_read_group(self, domain, fields, groupby, lazy):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        live_report = report.with_context(theoretical_report_live=True)
+        self.assertIsNotNone(
+            report._read_group_rollup(domain, fields, groupby, lazy=lazy)
+        )
+        res = report.read_group(domain, fields, groupby, lazy=lazy)
+        expected = live_report.read_group(domain, fields, groupby, lazy=lazy)
+        self.assertEqual(len(res), len(expected))
+        count_key = "%s_count" % groupby[0] if lazy else "__count"
+        keys = (groupby[:1] if lazy else groupby) + [
+            "worked_hours",
+            "theoretical_hours",
+            "difference",
+            count_key,
+        ]
+        for group, expected_group in zip(res, expected):
+            self.assertEqual(
+                {key: group[key] for key in keys},
+                {key: expected_group[key] for key in keys},
+            )
+            self.assertEqual(
+                live_report.search_count(group["__domain"]), group[count_key]
+            )
+
+    def test_rollup_report(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        self.env["ir.config_parameter"].sudo().set_param(
+            "hr_attendance_report_theoretical_time.rollups", "True"
+        )
+        self.env["hr.attendance.theoretical.time.rollup"]._refresh(
+            date_from="1946-12-01", date_to="1946-12-31"
+        )
+        domain = [
+            ("employee_id", "in", (self.employee_1 | self.employee_2).ids),
+            ("date", ">=", "1946-12-01"),
+            ("date", "<", "1947-01-01"),
+        ]
+        fields = ["theoretical_hours:sum", "worked_hours:sum", "difference:sum"]
+        for lazy in (True, False):
+            self._assert_rollup_read_group(
+                domain, fields, ["employee_id", "date:month"], lazy
+            )
+            self._assert_rollup_read_group(
+                domain, fields, ["department_id", "date:month"], lazy
+            )
+        res = report.read_group(domain, fields, ["employee_id", "date:month"])
+        self.assertEqual(res[0]["worked_hours"], 32)
+        self.assertEqual(res[0]["theoretical_hours"], 40)
+        self.assertEqual(res[0]["difference"], -8)
+        # Totals are refreshed on changes
+        self.attendances[1].check_out = "1946-12-23 19:00:00"
+        res = report.read_group(domain, fields, ["employee_id", "date:month"])
+        self.assertEqual(res[0]["worked_hours"], 33)
+        self.assertEqual(res[0]["difference"], -7)
+        # Not for days or bounds in the middle of the periods
+        self.assertIsNone(
+            report._read_group_rollup(domain, fields, ["employee_id", "date:day"])
+        )
+        self.assertIsNone(
+            report._read_group_rollup(
+                [("date", ">=", "1946-12-23")], fields, ["date:month"]
+            )
+        )
+        # Nor for other aggregators than the sum
+        self.assertIsNone(
+            report._read_group_rollup(
+                domain, ["worked_hours:avg"], ["employee_id", "date:month"]
+            )
+        )
+        self.assertIsNone(
+            report._read_group_rollup(
+                domain, ["difference:max"], ["employee_id", "date:month"]
+            )
+        )
+
+    def test_theoretical_balance(self):
+        Balance = self.env["hr.attendance.theoretical.balance"]
+        employee = self.employee_1.with_context(theoretical_balance_date="1946-12-24")
+        self.assertEqual(employee.theoretical_balance, 0)
+        # 1947-01-01 to 1947-01-15 are 11 working days without attendances
+        employee = employee.with_context(theoretical_balance_date="1947-01-15")
+        self.assertEqual(employee.theoretical_balance, -96)
+        checkpoints = Balance.search([("employee_id", "=", self.employee_1.id)])
+        self.assertEqual(
+            checkpoints.mapped("date"),
+            [datetime.date(1946, 11, 30), datetime.date(1946, 12, 31)],
+        )
+        self.assertEqual(checkpoints.mapped("balance"), [0, -8])
+        self.assertEqual(
+            Balance._get_balances(self.employee_1, "1946-12-31"),
+            {self.employee_1.id: -8},
+        )
+        # Back-dated changes drop the checkpoints after them
+        self.attendances[1].check_out = "1946-12-23 19:00:00"
+        self.assertEqual(checkpoints.exists(), checkpoints[0])
+        employee.invalidate_cache(["theoretical_balance"])
+        self.assertEqual(employee.theoretical_balance, -95)
+        checkpoints = Balance.search([("employee_id", "=", self.employee_1.id)])
+        self.assertEqual(checkpoints.mapped("balance"), [0, -7])
+        # Nothing counts before the theoretical hours start date
+        self.employee_1.theoretical_hours_start_date = "1947-01-01"
+        employee.invalidate_cache(["theoretical_balance"])
+        self.assertEqual(employee.theoretical_balance, -88)
+
+    def test_instrumentation(self):
+        Stat = self.env["hr.attendance.theoretical.stat"]
+        Stat.action_reset()
+        self.env["hr.attendance.theoretical.time.report"].read_group(
+            [("date", ">=", "1946-12-23"), ("date", "<=", "1946-12-31")],
+            ["difference"],
+            ["employee_id"],
+        )
+        stats = {stat.phase: stat for stat in Stat._take_snapshot()}
+        self.assertEqual(stats["report.read_group"].calls, 1)
+        self.assertGreater(stats["report.read_group"].queries, 0)
+        self.assertGreaterEqual(
+            stats["report.read_group"].total_time,
+            stats["report.read_group.query"].total_time,
+        )
+        self.assertIn("report.fill_days.query", stats)
+        action = Stat.action_view_snapshot()
+        self.assertEqual(action["res_model"], "hr.attendance.theoretical.stat")
+
     def test_change_hr_holidays_public(self):
         self.public_holiday_global.line_ids[0].write({"date": "1946-12-23"})
         # 1946-12-23
@@ -255,11 +701,61 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
         self.assertEqual(self.attendances[4].theoretical_hours, 8)
         self.assertEqual(self.attendances[12].theoretical_hours, 8)
 
+    def test_hr_holidays_public_scope(self):
+        # Holiday for other state of the country of employee 2
+        line = self.env["hr.holidays.public.line"].create(
+            {
+                "name": "Regional holiday",
+                "date": "1946-12-26",
+                "year_id": self.public_holiday_country.id,
+                "state_ids": [(6, 0, self.env.ref("base.state_es_m").ids)],
+            }
+        )
+        self.assertEqual(self.attendances[14].theoretical_hours, 8)
+        line.state_ids = [(6, 0, self.address_2.state_id.ids)]
+        self.assertEqual(self.attendances[14].theoretical_hours, 0)
+        line.unlink()
+        self.assertEqual(self.attendances[14].theoretical_hours, 8)
+
     def test_change_hr_holidays(self):
         self.leave.action_refuse()
         # 1946-12-26 - Employee 2
         self.assertEqual(self.attendances[14].theoretical_hours, 8)
 
+    def test_change_hr_holidays_batch(self):
+        leaves = self.HrLeave
+        for employee, day in ((self.employee_1, 23), (self.employee_2, 26)):
+            leaves |= self.HrLeave.create(
+                {
+                    "date_from": "1946-12-%s 00:00:00" % day,
+                    "date_to": "1946-12-%s 23:59:59" % day,
+                    "request_date_from": "1946-12-%s" % day,
+                    "request_date_to": "1946-12-%s" % day,
+                    "employee_id": employee.id,
+                    "holiday_status_id": self.leave_type.id,
+                }
+            )
+        self.assertEqual(
+            (leaves | self.leave)._get_theoretical_date_ranges(),
+            {
+                self.employee_1: [
+                    (datetime.date(1946, 12, 23), datetime.date(1946, 12, 23)),
+                    (datetime.date(1946, 12, 26), datetime.date(1946, 12, 26)),
+                ],
+                self.employee_2: [
+                    (datetime.date(1946, 12, 26), datetime.date(1946, 12, 26))
+                ],
+            },
+        )
+        leaves.action_validate()
+        # 1946-12-23 - Employee 1
+        self.assertEqual(self.attendances[0].theoretical_hours, 0)
+        # 1946-12-26 - Employee 2
+        self.assertEqual(self.attendances[14].theoretical_hours, 0)
+        leaves.action_refuse()
+        self.assertEqual(self.attendances[0].theoretical_hours, 8)
+        self.assertEqual(self.attendances[14].theoretical_hours, 8)
+
     def test_hr_holidays_status_include_in_theoretical(self):
         obj = self.env["hr.attendance.theoretical.time.report"]
         self.leave.holiday_status_id.include_in_theoretical = True
@@ -267,6 +763,28 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
         a = self.attendances[6]
         self.assertEqual(obj._theoretical_hours(a.employee_id, a.check_in), 8)
 
+    def test_theoretical_hours_follow_changes(self):
+        obj = self.env["hr.attendance.theoretical.time.report"]
+        date = datetime.date(1946, 12, 27)
+        self.assertEqual(obj._theoretical_hours(self.employee_1, date), 8)
+        self.public_holiday_global.line_ids = [
+            (0, 0, {"name": "After Christmas", "date": "1946-12-27"})
+        ]
+        self.assertEqual(obj._theoretical_hours(self.employee_1, date), 0)
+        self.public_holiday_global.line_ids.filtered(lambda x: x.date == date).unlink()
+        self.assertEqual(obj._theoretical_hours(self.employee_1, date), 8)
+        self.calendar.attendance_ids.filtered(
+            lambda x: x.dayofweek == "4" and x.hour_from == 14.0
+        ).hour_to = 16
+        self.assertEqual(obj._theoretical_hours(self.employee_1, date), 6)
+
+    def test_leave_type_include_in_theoretical_recompute(self):
+        self.assertEqual(self.attendances[6].theoretical_hours, 0)
+        self.leave.holiday_status_id.include_in_theoretical = True
+        # 1946-12-26 - Employee 1
+        self.assertEqual(self.attendances[6].theoretical_hours, 8)
+        self.assertEqual(self.attendances[7].theoretical_hours, 8)
+
     def test_wizard_theoretical_time(self):
         department = self.env["hr.department"].create({"name": "Department"})
         tag = self.env["hr.employee.category"].create({"name": "Tag"})
@@ -276,13 +794,97 @@ class TestHrAttendanceReportTheoreticalTime(TestHrAttendanceReportTheoreticalTim
         wizard = self.env["wizard.theoretical.time"].create(
             {"department_id": department.id, "category_ids": [(4, tag.id)]}
         )
+        # The report is filtered by the filters of the wizard
+        domain = [
+            ("employee_id.category_ids", "in", tag.ids),
+            ("employee_id.department_id", "child_of", department.id),
+            ("employee_id.active", "=", True),
+        ]
+        self.assertEqual(wizard.view_report()["domain"], domain)
         wizard.populate()
         report = wizard.view_report()
         self.assertTrue(wizard.employee_ids)
         self.assertEqual(wizard.employee_ids[0].name, self.employee_1.name)
+        self.assertFalse(wizard.hand_picked)
+        self.assertEqual(report["domain"], domain)
+        res = self.env["hr.attendance.theoretical.time.report"].read_group(
+            domain + [("date", ">=", "1946-12-01"), ("date", "<=", "1946-12-31")],
+            ["difference"],
+            ["employee_id"],
+        )
+        self.assertEqual([x["employee_id"][0] for x in res], self.employee_1.ids)
+        # Unless the employees are picked by hand
+        with common.Form(wizard) as wizard_form:
+            wizard_form.employee_ids.add(self.employee_2)
+        self.assertTrue(wizard.hand_picked)
+        self.assertEqual(
+            wizard.view_report()["domain"],
+            [("employee_id", "in", (self.employee_1 | self.employee_2).ids)],
+        )
+        # Changing the filters clears the list picked by hand
+        with common.Form(wizard) as wizard_form:
+            wizard_form.category_ids.clear()
+        self.assertFalse(wizard.employee_ids)
+        self.assertFalse(wizard.hand_picked)
         self.assertEqual(
-            report["domain"], [("employee_id", "in", [self.employee_1.id])]
+            wizard.view_report()["domain"],
+            [
+                ("employee_id.department_id", "child_of", department.id),
+                ("employee_id.active", "=", True),
+            ],
+        )
+
+    def test_export_totals(self):
+        report = self.env["hr.attendance.theoretical.time.report"]
+        self.employee_1.identification_id = "E1"
+        wizard = self.env["wizard.theoretical.time"].create(
+            {
+                "employee_ids": [(6, 0, self.employee_1.ids)],
+                "export_date_from": "1946-12-01",
+                "export_date_to": "1946-12-31",
+            }
+        )
+        self.assertIn("wizard_id=%s" % wizard.id, wizard.action_export()["url"])
+        domain = wizard._prepare_export_domain()
+        rows = list(report._export_totals(domain, period="month", fetch_size=1))
+        # Same totals as the report
+        res = report.read_group(
+            domain,
+            ["worked_hours", "theoretical_hours", "difference"],
+            ["employee_id", "date:month"],
+            lazy=False,
+        )
+        self.assertEqual(len(res), 1)
+        self.assertEqual(
+            rows,
+            [
+                (
+                    "Employee 1",
+                    "E1",
+                    datetime.date(1946, 12, 1),
+                    res[0]["worked_hours"],
+                    res[0]["theoretical_hours"],
+                    res[0]["difference"],
+                )
+            ],
+        )
+        self.assertEqual(res[0]["worked_hours"], 32)
+        self.assertEqual(res[0]["theoretical_hours"], 40)
+        rows = list(report._export_totals(domain, period="week"))
+        self.assertEqual(
+            [row[2] for row in rows],
+            [datetime.date(1946, 12, 23), datetime.date(1946, 12, 30)],
+        )
+        content = b"".join(report._export_totals_csv(domain)).decode()
+        self.assertEqual(
+            content.splitlines(),
+            [
+                "Employee,Identification No,Period,Worked,Theoric,Difference",
+                "Employee 1,E1,1946-12-01,32.0,40.0,-8.0",
+            ],
         )
+        content = b"".join(report._export_totals_xlsx(domain))
+        self.assertTrue(content.startswith(b"PK"))
 
 
 class TestHrAttendanceReportTheoreticalTimeResource(TestResourceCommon):
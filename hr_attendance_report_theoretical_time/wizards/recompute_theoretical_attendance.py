@@ -2,6 +2,8 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 from odoo import fields, models
 
+from ..models.hr_attendance_theoretical_stat import instrument
+
 
 class RecomputeTheoreticalAttendance(models.TransientModel):
     _name = "recompute.theoretical.attendance"
@@ -21,13 +23,10 @@ class RecomputeTheoreticalAttendance(models.TransientModel):
     )
 
     def action_recompute(self):
+        """Queue the recomputation, which is done in background."""
         self.ensure_one()
-        attendances = self.env["hr.attendance"].search(
-            [
-                ("employee_id", "in", self.employee_ids.ids),
-                ("check_in", ">=", self.date_from),
-                ("check_out", "<=", self.date_to),
-            ]
-        )
-        attendances._compute_theoretical_hours()
+        with instrument(self.env, "recompute.wizard"):
+            self.env["recompute.theoretical.attendance.job"]._enqueue(
+                self.employee_ids, self.date_from, self.date_to
+            )
         return {"type": "ir.actions.act_window_close"}
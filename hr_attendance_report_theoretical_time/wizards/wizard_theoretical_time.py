@@ -2,7 +2,10 @@
 # Copyright 2021 Tecnativa - Víctor Martínez
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from dateutil.relativedelta import relativedelta
+
 from odoo import _, api, fields, models
+from odoo.exceptions import UserError
 
 
 class WizardTheoreticalTime(models.TransientModel):
@@ -11,9 +14,37 @@ class WizardTheoreticalTime(models.TransientModel):
     _description = "Filtered Theoretical Time"
 
     employee_ids = fields.Many2many(comodel_name="hr.employee", string="Employees")
+    hand_picked = fields.Boolean(
+        help="The list of employees has been edited, so the report is filtered "
+        "by them instead of by the department and tags",
+    )
 
     department_id = fields.Many2one(comodel_name="hr.department", string="Department")
     category_ids = fields.Many2many(comodel_name="hr.employee.category", string="Tag")
+    export_date_from = fields.Date(
+        string="Export From",
+        default=lambda self: self._default_export_date_from(),
+    )
+    export_date_to = fields.Date(
+        string="Export To",
+        default=lambda self: self._default_export_date_to(),
+    )
+    export_period = fields.Selection(
+        selection=[("week", "Week"), ("month", "Month"), ("year", "Year")],
+        default="month",
+        help="Period for which the totals of each employee are exported",
+    )
+    export_format = fields.Selection(
+        selection=[("csv", "CSV"), ("xlsx", "XLSX")], default="csv"
+    )
+
+    @api.model
+    def _default_export_date_from(self):
+        return fields.Date.context_today(self).replace(day=1) - relativedelta(months=1)
+
+    @api.model
+    def _default_export_date_to(self):
+        return fields.Date.context_today(self).replace(day=1) - relativedelta(days=1)
 
     @api.model
     def default_get(self, fields):
@@ -35,9 +66,25 @@ class WizardTheoreticalTime(models.TransientModel):
             res.append(("department_id", "child_of", self.department_id.id))
         return res
 
+    @api.onchange("department_id", "category_ids")
+    def _onchange_employee_filters(self):
+        """The filters apply again, so the list populated from the previous
+        ones is outdated.
+        """
+        self.employee_ids = False
+
+    @api.onchange("employee_ids")
+    def _onchange_employee_ids(self):
+        self.hand_picked = bool(self.employee_ids)
+
     def populate(self):
         domain = self._prepare_employee_domain()
-        self.employee_ids = self.env["hr.employee"].search(domain)
+        self.write(
+            {
+                "employee_ids": [(6, 0, self.env["hr.employee"].search(domain).ids)],
+                "hand_picked": False,
+            }
+        )
         action = {
             "name": _("Select Employees to Analyze Theoretical Time"),
             "type": "ir.actions.act_window",
@@ -54,10 +101,45 @@ class WizardTheoreticalTime(models.TransientModel):
         action = self.env["ir.actions.act_window"]._for_xml_id(
             "hr_attendance_report_theoretical_time.hr_attendance_theoretical_action"
         )
-        action["domain"] = [
-            ("employee_id", "in", self.with_context(active_test=False).employee_ids.ids)
-        ]
+        action["domain"] = self._prepare_report_domain()
         action[
             "context"
         ] = "{'search_default_previous_month': 1, 'search_default_current_month': 1}"
         return action
+
+    def _prepare_report_domain(self):
+        """Filter the report by the employees picked by hand, or otherwise by
+        the filters themselves, so that the domain stays small whatever the
+        number of employees matching them. Archived employees are excluded as
+        when populating the list.
+        """
+        employee_domain = self._prepare_employee_domain()
+        if employee_domain and not self.hand_picked:
+            employee_domain.append(("active", "=", True))
+            return [
+                ("employee_id.%s" % field_name, operator, value)
+                for field_name, operator, value in employee_domain
+            ]
+        return [
+            ("employee_id", "in", self.with_context(active_test=False).employee_ids.ids)
+        ]
+
+    def _prepare_export_domain(self):
+        return self._prepare_report_domain() + [
+            ("date", ">=", self.export_date_from),
+            ("date", "<=", self.export_date_to),
+        ]
+
+    def action_export(self):
+        """Download the totals of the selected employees for each period,
+        streamed by the export controller.
+        """
+        self.ensure_one()
+        if not self.export_date_from or not self.export_date_to:
+            raise UserError(_("You must set the dates of the export."))
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/hr_attendance_report_theoretical_time/export?wizard_id=%s"
+            % self.id,
+            "target": "self",
+        }